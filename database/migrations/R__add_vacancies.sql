@@ -1,4 +1,10 @@
 -- used to add several brand new vacancies
+DROP PROCEDURE IF EXISTS work_scraper.add_vacancies(
+    TEXT[], TEXT[], DOUBLE PRECISION[], DOUBLE PRECISION[], BOOLEAN[],
+    BOOLEAN[], TIMESTAMP[], TIMESTAMP[], TEXT[], TEXT[], TEXT[], TEXT,
+    TEXT[], JSONB[]
+);
+
 CREATE OR REPLACE PROCEDURE work_scraper.add_vacancies(
     title TEXT[],
     employer TEXT[],
@@ -13,7 +19,8 @@ CREATE OR REPLACE PROCEDURE work_scraper.add_vacancies(
     web_id TEXT[],
     source TEXT,
     description TEXT[],
-    summarized JSONB[]
+    summarized JSONB[],
+    content_hash TEXT[]
 )
 LANGUAGE plpgsql
 SECURITY DEFINER
@@ -33,8 +40,8 @@ BEGIN
     -- inserting vacancies
     INSERT INTO work_scraper.vacancies (
         title, employer, salary_min, salary_max, is_hourly_rate, remote,
-        published, expires, country, city, last_checked, vacancy_web_id,
-        web_source, description, summarized_description
+        published, expires, country, city, last_checked, next_check_at,
+        vacancy_web_id, web_source, description, summarized_description, content_hash
     )
     -- converting parameter column arrays and procedure variables to table
     SELECT
@@ -49,10 +56,12 @@ BEGIN
         country_ids[i],
         city_ids[i],
         curtime,
+        work_scraper.vacancy_next_check(curtime, expires[i]),
         web_id[i],
         source_id,
         description[i],
-        summarized[i]
+        summarized[i],
+        content_hash[i]
     FROM generate_subscripts(title, 1) AS i -- positional index for alignment
     ON CONFLICT DO NOTHING;
 END;
@@ -0,0 +1,47 @@
+-- returns the daily vacancy count and salaries of every keyword in the summarized
+-- description category (e.g. programming_languages) published between from_day and to_day
+-- (inclusive). Counts can be summed into longer periods, salaries are per day
+CREATE OR REPLACE FUNCTION work_scraper.get_skill_stats(
+    source TEXT,
+    skill_category TEXT,
+    from_day DATE,
+    to_day DATE
+)
+RETURNS TABLE(
+    day DATE,
+    keyword TEXT,
+    vacancies INTEGER,
+    salaried_vacancies INTEGER,
+    salary_min DOUBLE PRECISION,
+    salary_median DOUBLE PRECISION,
+    salary_max DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+AS $$
+DECLARE
+    source_id INTEGER;
+BEGIN
+    SELECT work_scraper.get_website_id(source) INTO source_id;
+    -- handling invalid source input
+    IF source_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        st.day,
+        st.keyword,
+        st.vacancies,
+        st.salaried_vacancies,
+        st.salary_min,
+        st.salary_median,
+        st.salary_max
+    FROM work_scraper.skill_stats st
+    WHERE st.web_source = source_id
+        AND st.category = skill_category
+        AND st.day BETWEEN from_day AND to_day
+    ORDER BY st.day, st.keyword;
+END;
+$$;
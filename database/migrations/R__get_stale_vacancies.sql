@@ -1,8 +1,15 @@
--- returns up to 20 vacancy web ids and row ids that are stale for the given source
+-- returns up to batch_size vacancy web ids, row ids, content hashes and summary keyword versions that are stale for the given source
+-- (the longest due first), the vacancies are reserved for the lease duration (release_stale_vacancies ends it early)
+DROP FUNCTION IF EXISTS work_scraper.get_stale_vacancies(TEXT);
+-- the returned columns have changed
+DROP FUNCTION IF EXISTS work_scraper.get_stale_vacancies(TEXT, INTEGER, INTERVAL);
+
 CREATE OR REPLACE FUNCTION work_scraper.get_stale_vacancies(
-    source TEXT
+    source TEXT,
+    batch_size INTEGER,
+    lease INTERVAL
 )
-RETURNS TABLE(vacancy_web_id TEXT, db_id INTEGER)
+RETURNS TABLE(vacancy_web_id TEXT, db_id INTEGER, content_hash TEXT, keywords_version TEXT)
 LANGUAGE plpgsql
 SECURITY DEFINER
 AS $$
@@ -17,27 +24,42 @@ BEGIN
         RETURN;
     END IF;
 
+    -- due vacancies that expired more than a day ago (weren't checked in time) won't be checked anymore,
+    -- unscheduling them so they don't have to be skipped by every reservation
+    UPDATE work_scraper.vacancies v
+    SET next_check_at = NULL
+    WHERE v.id IN (
+        SELECT e.id
+        FROM work_scraper.vacancies e
+        WHERE e.web_source = source_id
+            AND e.next_check_at <= curtime
+            AND e.expires + INTERVAL '24 hours' < curtime
+        FOR UPDATE SKIP LOCKED
+    );
+
     RETURN QUERY
     WITH to_update AS (
-        -- getting vacancies to update
-        SELECT v.vacancy_web_id, v.id
+        -- getting vacancies to update, an index range scan over the due vacancies of the source
+        SELECT v.vacancy_web_id, v.id, v.content_hash, v.summarized_description->>'keywords_version' AS keywords_version
         FROM work_scraper.vacancies v
-        WHERE curtime >= v.last_checked + INTERVAL '5 days'
-            AND v.web_source = source_id
+        WHERE v.web_source = source_id
+            AND v.next_check_at <= curtime
             -- ignoring vacancies that are expired more than a day ago
             AND (v.expires IS NULL OR curtime <= v.expires + INTERVAL '24 hours')
-        LIMIT 20
+        ORDER BY v.next_check_at
+        LIMIT batch_size
         FOR UPDATE SKIP LOCKED -- locking for update
     ),
     updated AS (
         -- reserving their time
         UPDATE work_scraper.vacancies v
-        SET last_checked = curtime - INTERVAL '4 days 22 hours' -- reserving for 2 hours
+        SET last_checked = curtime - INTERVAL '5 days' + lease, -- reserving for the lease duration
+            next_check_at = work_scraper.vacancy_next_check(curtime - INTERVAL '5 days' + lease, v.expires)
         FROM to_update tu
         WHERE v.id = tu.id
     )
-    -- returning vacancy web ids and database ids
-    SELECT tu.vacancy_web_id, tu.id
+    -- returning vacancy web ids, database ids, content hashes and summary keyword versions
+    SELECT tu.vacancy_web_id, tu.id, tu.content_hash, tu.keywords_version
     FROM to_update tu;
 END;
 $$;
\ No newline at end of file
@@ -1,6 +1,11 @@
--- returns up to 20 unscanned vacancy web ids and row ids that are stale for the given source
+-- returns up to batch_size unscanned vacancy web ids and row ids that aren't reserved for the given source
+-- (the longest waiting first), the vacancies are reserved for the lease duration (release_unscanned_vacancies ends it early)
+DROP FUNCTION IF EXISTS work_scraper.get_unscanned_vacancies(TEXT);
+
 CREATE OR REPLACE FUNCTION work_scraper.get_unscanned_vacancies(
-    source TEXT
+    source TEXT,
+    batch_size INTEGER,
+    lease INTERVAL
 )
 RETURNS TABLE(vacancy_web_id TEXT, db_id INTEGER)
 LANGUAGE plpgsql
@@ -22,15 +27,18 @@ BEGIN
         -- getting unscanned vacancies to update
         SELECT v.vacancy_web_id, v.id
         FROM work_scraper.unscanned_vacancies v
-        WHERE curtime >= v.last_checked + INTERVAL '2 hours' -- only checking those that are unscanned for more than 2hrs
-            AND v.web_source = source_id
-        LIMIT 20
+        WHERE v.web_source = source_id
+            -- only checking those that aren't reserved, compared without arithmetic
+            -- on the column so it's an index range scan
+            AND v.last_checked <= curtime - INTERVAL '2 hours'
+        ORDER BY v.last_checked
+        LIMIT batch_size
         FOR UPDATE SKIP LOCKED -- locking for update
     ),
     updated AS (
         -- reserving their time
         UPDATE work_scraper.unscanned_vacancies v
-        SET last_checked = curtime
+        SET last_checked = curtime - INTERVAL '2 hours' + lease -- reserving for the lease duration
         FROM to_update tu
         WHERE v.id = tu.id
     )
@@ -1,5 +1,5 @@
--- returns X amount of vacancies starting from skip_amount offset
--- based on provided source, whether they're fully checked and expiration time
+-- returns all vacancies based on provided source, whether they're fully checked
+-- and expiration time, get_vacancies_page should be used for paged access
 CREATE OR REPLACE FUNCTION work_scraper.get_vacancies(
     source TEXT,
     -- amount INTEGER,
@@ -37,13 +37,14 @@ DECLARE
     source_id INTEGER;
     expiration_filter TIMESTAMP;
     publishing_filter TIMESTAMP := now() - max_age;
-    employers_filter INTEGER[];
-    countries_filter INTEGER[];
-    cities_filter INTEGER[];
+    -- empty arrays include everything
+    filter_employers BOOLEAN := coalesce(cardinality(employers), 0) > 0;
+    filter_countries BOOLEAN := coalesce(cardinality(countries), 0) > 0;
+    filter_cities BOOLEAN := coalesce(cardinality(cities), 0) > 0;
 BEGIN
     SELECT work_scraper.get_website_id(source) INTO source_id;
     -- handling invalid source input
-    IF NOT FOUND THEN
+    IF source_id IS NULL THEN
         RETURN;
     END IF;
 
@@ -54,30 +55,6 @@ BEGIN
         expiration_filter := now();
     END IF;
     
-    IF cardinality(employers) = 0 THEN
-        -- employers filter empty, including all employers
-        SELECT id INTO employers_filter
-        FROM work_scraper.employers;
-    ELSE
-        employers_filter := employers;
-    END IF;
-    
-    IF cardinality(countries) = 0 THEN
-        -- countries filter empty, including all countries
-        SELECT id INTO countries_filter
-        FROM work_scraper.countries;
-    ELSE
-        countries_filter := countries;
-    END IF;
-
-    IF cardinality(cities) = 0 THEN
-        -- cities filter empty, including all cities
-        SELECT id INTO cities_filter
-        FROM work_scraper.cities;
-    ELSE
-        cities_filter := cities;
-    END IF;
-
     RETURN QUERY
     SELECT
         v.id,
@@ -98,9 +75,9 @@ BEGIN
     WHERE v.web_source = source_id
         AND v.expires > expiration_filter
         AND v.published >= publishing_filter
-        AND (v.employer IS NULL OR v.employer = ANY(employers_filter))
-        AND (v.country IS NULL OR v.country = ANY(countries_filter))
-        AND (v.city IS NULL OR v.city = ANY(cities_filter))
+        AND (NOT filter_employers OR v.employer IS NULL OR v.employer = ANY(employers))
+        AND (NOT filter_countries OR v.country IS NULL OR v.country = ANY(countries))
+        AND (NOT filter_cities OR v.city IS NULL OR v.city = ANY(cities))
         AND (v.is_hourly_rate IS NULL OR v.is_hourly_rate = salary_hourly)
         AND (v.remote IS NULL OR v.remote = remote_job)
         AND (
@@ -0,0 +1,99 @@
+-- returns up to page_size vacancies, newest first, based on provided source,
+-- expiration time and filters. Empty employers, countries and cities arrays don't filter.
+-- The next page is retrieved by passing the published time and id of the last returned
+-- vacancy as after_published and after_id (NULL for the first page).
+-- description and summarized_description are only returned if with_description is set
+CREATE OR REPLACE FUNCTION work_scraper.get_vacancies_page(
+    source TEXT,
+    include_expired BOOLEAN,
+    employers INTEGER[],
+    min_salary DOUBLE PRECISION,
+    max_salary DOUBLE PRECISION,
+    salary_hourly BOOLEAN,
+    remote_job BOOLEAN,
+    max_age INTERVAL,
+    countries INTEGER[],
+    cities INTEGER[],
+    page_size INTEGER,
+    after_published TIMESTAMP,
+    after_id INTEGER,
+    with_description BOOLEAN
+)
+RETURNS TABLE(
+    db_id INTEGER,
+    title TEXT,
+    employer_id INTEGER,
+    salary_min DOUBLE PRECISION,
+    salary_max DOUBLE PRECISION,
+    is_hourly_rate BOOLEAN,
+    remote BOOLEAN,
+    published TIMESTAMP,
+    expires TIMESTAMP,
+    country_id INTEGER,
+    city_id INTEGER,
+    vacancy_web_id TEXT,
+    description TEXT,
+    summarized_description JSONB
+)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+AS $$
+DECLARE
+    source_id INTEGER;
+    expiration_filter TIMESTAMP;
+    publishing_filter TIMESTAMP := now() - max_age;
+    filter_employers BOOLEAN := coalesce(cardinality(employers), 0) > 0;
+    filter_countries BOOLEAN := coalesce(cardinality(countries), 0) > 0;
+    filter_cities BOOLEAN := coalesce(cardinality(cities), 0) > 0;
+BEGIN
+    SELECT work_scraper.get_website_id(source) INTO source_id;
+    -- handling invalid source input
+    IF source_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF include_expired = TRUE THEN
+        -- includes expired vacancies
+        expiration_filter := timestamp 'epoch';
+    ELSE
+        expiration_filter := now();
+    END IF;
+
+    -- published can't be NULL in the result (it's filtered by max_age),
+    -- so (published, id) can be compared as a row
+    RETURN QUERY
+    SELECT
+        v.id,
+        v.title,
+        v.employer,
+        v.salary_min,
+        v.salary_max,
+        v.is_hourly_rate,
+        v.remote,
+        v.published,
+        v.expires,
+        v.country,
+        v.city,
+        v.vacancy_web_id,
+        -- not reading the large columns at all if they aren't needed
+        CASE WHEN with_description THEN v.description END,
+        CASE WHEN with_description THEN v.summarized_description END
+    FROM work_scraper.vacancies v
+    WHERE v.web_source = source_id
+        AND v.expires > expiration_filter
+        AND v.published >= publishing_filter
+        AND (after_id IS NULL OR (v.published, v.id) < (after_published, after_id))
+        AND (NOT filter_employers OR v.employer IS NULL OR v.employer = ANY(employers))
+        AND (NOT filter_countries OR v.country IS NULL OR v.country = ANY(countries))
+        AND (NOT filter_cities OR v.city IS NULL OR v.city = ANY(cities))
+        AND (v.is_hourly_rate IS NULL OR v.is_hourly_rate = salary_hourly)
+        AND (v.remote IS NULL OR v.remote = remote_job)
+        AND (
+            (v.salary_min IS NULL OR v.salary_max IS NULL) OR
+            (v.salary_max >= min_salary AND v.salary_max <= max_salary)
+            )
+    ORDER BY v.published DESC, v.id DESC
+    LIMIT page_size;
+END;
+$$;
@@ -0,0 +1,45 @@
+-- returns ids, titles, descriptions and summarized description languages of up to batch_size
+-- vacancies with ids above after_id of the given source (all sources if NULL) that weren't
+-- summarized with the given keywords version (NULL returns all), ordered by id. Used to
+-- re-summarize stored vacancies after keywords.json has changed, a page at a time
+-- (the next page starts after the last returned id), so the result is never materialized as a whole
+DROP FUNCTION IF EXISTS work_scraper.get_vacancy_descriptions(TEXT);
+DROP FUNCTION IF EXISTS work_scraper.get_vacancy_descriptions(TEXT, TEXT);
+
+CREATE OR REPLACE FUNCTION work_scraper.get_vacancy_descriptions(
+    source TEXT,
+    keywords_version TEXT,
+    after_id INTEGER,
+    batch_size INTEGER
+)
+RETURNS TABLE(db_id INTEGER, title TEXT, description TEXT, languages JSONB)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+AS $$
+DECLARE
+    source_id INTEGER;
+BEGIN
+    -- plpgsql, a sql body would be checked when created, before R__get_website_id exists on a new database
+    IF source IS NOT NULL THEN
+        SELECT work_scraper.get_website_id(source) INTO source_id;
+        -- handling invalid source input
+        IF source_id IS NULL THEN
+            RETURN;
+        END IF;
+    END IF;
+
+    RETURN QUERY
+    SELECT v.id, v.title, v.description, v.summarized_description->'languages'
+    FROM work_scraper.vacancies v
+    WHERE v.id > after_id
+        AND (source_id IS NULL OR v.web_source = source_id)
+        AND v.description IS NOT NULL
+        AND (
+            get_vacancy_descriptions.keywords_version IS NULL OR
+            v.summarized_description->>'keywords_version' IS DISTINCT FROM get_vacancy_descriptions.keywords_version
+            )
+    ORDER BY v.id -- primary key range scan
+    LIMIT batch_size;
+END;
+$$;
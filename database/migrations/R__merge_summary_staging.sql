@@ -0,0 +1,16 @@
+-- used to bulk replace summarized descriptions of existing vacancies, the summaries
+-- must be in the session's summary_staging temporary table (vacancy_id INTEGER,
+-- summarized JSONB), see scrapers/utils/db_connection.py
+CREATE OR REPLACE PROCEDURE work_scraper.merge_summary_staging()
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    UPDATE work_scraper.vacancies v
+    SET summarized_description = s.summarized
+    FROM pg_temp.summary_staging s
+    WHERE v.id = s.vacancy_id
+        -- not rewriting rows whose summary didn't change
+        AND v.summarized_description IS DISTINCT FROM s.summarized;
+END;
+$$;
@@ -0,0 +1,100 @@
+-- used to bulk insert or update vacancies (backfills, re-imports), the vacancies must be
+-- in the session's vacancy_staging temporary table (see scrapers/utils/db_connection.py).
+-- Vacancies are matched by their web id, if only_changed is set, existing vacancies
+-- with the same content hash and summary keywords version are left as they are
+CREATE OR REPLACE PROCEDURE work_scraper.merge_vacancy_staging(
+    source TEXT,
+    only_changed BOOLEAN
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    curtime TIMESTAMP := now();
+    source_id INTEGER;
+BEGIN
+    SELECT work_scraper.get_website_id(source) INTO source_id;
+
+    -- handling invalid source input
+    IF source_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- inserting missing employers, countries and cities
+    INSERT INTO work_scraper.employers (title)
+    SELECT DISTINCT s.employer
+    FROM pg_temp.vacancy_staging s
+    WHERE s.employer IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO work_scraper.countries (country_code)
+    SELECT DISTINCT s.country_code
+    FROM pg_temp.vacancy_staging s
+    WHERE s.country_code IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO work_scraper.cities (city_name)
+    SELECT DISTINCT s.city_name
+    FROM pg_temp.vacancy_staging s
+    WHERE s.city_name IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    -- inserting new and updating existing vacancies
+    INSERT INTO work_scraper.vacancies AS l (
+        title, employer, salary_min, salary_max, is_hourly_rate, remote,
+        published, expires, country, city, last_checked, next_check_at,
+        vacancy_web_id, web_source, description, summarized_description, content_hash
+    )
+    SELECT DISTINCT ON (s.vacancy_web_id) -- a row can only be updated once per statement
+        s.title,
+        e.id,
+        s.salary_min,
+        s.salary_max,
+        s.is_hourly,
+        s.remote,
+        s.published,
+        s.expires,
+        co.id,
+        ci.id,
+        curtime,
+        work_scraper.vacancy_next_check(curtime, s.expires),
+        s.vacancy_web_id,
+        source_id,
+        s.description,
+        s.summarized,
+        s.content_hash
+    FROM pg_temp.vacancy_staging s
+    -- left joins to keep nulls
+    LEFT JOIN work_scraper.employers e ON e.title = s.employer
+    LEFT JOIN work_scraper.countries co ON co.country_code = s.country_code
+    LEFT JOIN work_scraper.cities ci ON ci.city_name = s.city_name
+    ORDER BY s.vacancy_web_id
+    ON CONFLICT (web_source, vacancy_web_id) DO UPDATE
+    SET
+        title = EXCLUDED.title,
+        employer = EXCLUDED.employer,
+        salary_min = EXCLUDED.salary_min,
+        salary_max = EXCLUDED.salary_max,
+        is_hourly_rate = EXCLUDED.is_hourly_rate,
+        remote = EXCLUDED.remote,
+        published = EXCLUDED.published,
+        expires = EXCLUDED.expires,
+        country = EXCLUDED.country,
+        city = EXCLUDED.city,
+        last_checked = EXCLUDED.last_checked,
+        next_check_at = EXCLUDED.next_check_at,
+        description = EXCLUDED.description,
+        summarized_description = EXCLUDED.summarized_description,
+        content_hash = EXCLUDED.content_hash
+    WHERE NOT only_changed
+        OR EXCLUDED.content_hash IS NULL
+        OR l.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        OR l.summarized_description->>'keywords_version' IS DISTINCT FROM EXCLUDED.summarized_description->>'keywords_version';
+
+    -- ingested vacancies don't need to be scanned anymore
+    DELETE FROM work_scraper.unscanned_vacancies u
+    USING pg_temp.vacancy_staging s
+    WHERE u.web_source = source_id
+        AND u.vacancy_web_id = s.vacancy_web_id;
+END;
+$$;
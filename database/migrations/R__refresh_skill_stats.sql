@@ -0,0 +1,167 @@
+-- recomputes skill_stats rows of the given (day, source) pairs from the vacancies table
+CREATE OR REPLACE PROCEDURE work_scraper.refresh_skill_stats(
+    days DATE[],
+    sources INTEGER[]
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    -- refreshes of the same (source, day) are serialized until the end of the transaction, otherwise
+    -- two transactions changing vacancies of the same day would both recompute it without the other's
+    -- uncommitted vacancies. Once the locks are acquired, the statements below (new snapshots in
+    -- READ COMMITTED) see the vacancies committed by the transactions that held them.
+    -- Locked in sorted order, so two refreshes of overlapping days can't deadlock each other
+    PERFORM pg_advisory_xact_lock(k.web_source, k.day - DATE '2000-01-01')
+    FROM (
+        SELECT DISTINCT t.web_source, t.day
+        FROM unnest(days, sources) AS t(day, web_source)
+        ORDER BY t.web_source, t.day
+    ) k;
+
+    DELETE FROM work_scraper.skill_stats st
+    USING unnest(days, sources) AS t(day, web_source)
+    WHERE st.day = t.day
+        AND st.web_source = t.web_source;
+
+    INSERT INTO work_scraper.skill_stats (
+        day, web_source, category, keyword, vacancies, salaried_vacancies,
+        salary_min, salary_median, salary_max
+    )
+    SELECT
+        t.day,
+        t.web_source,
+        c.category,
+        k.keyword,
+        count(*),
+        count(*) FILTER (WHERE s.salaried),
+        min(sal.salary_low) FILTER (WHERE s.salaried),
+        percentile_cont(0.5) WITHIN GROUP (
+            ORDER BY (sal.salary_low + sal.salary_high) / 2
+        ) FILTER (WHERE s.salaried),
+        max(sal.salary_high) FILTER (WHERE s.salaried)
+    FROM unnest(days, sources) AS t(day, web_source)
+    JOIN work_scraper.vacancies v
+        ON v.web_source = t.web_source
+        AND v.published >= t.day
+        AND v.published < t.day + 1
+    CROSS JOIN LATERAL (
+        -- scrapers store 0 when the salary isn't given
+        SELECT
+            coalesce(nullif(v.salary_min, 0), nullif(v.salary_max, 0)) AS salary_low,
+            coalesce(nullif(v.salary_max, 0), nullif(v.salary_min, 0)) AS salary_high
+    ) sal
+    CROSS JOIN LATERAL (
+        SELECT v.is_hourly_rate IS NOT TRUE AND sal.salary_high IS NOT NULL AS salaried
+    ) s
+    CROSS JOIN LATERAL jsonb_each(v.summarized_description) AS c(category, keywords)
+    CROSS JOIN LATERAL jsonb_array_elements_text(c.keywords) AS k(keyword)
+    WHERE jsonb_typeof(c.keywords) = 'array'
+        AND c.category <> 'languages'
+    GROUP BY t.day, t.web_source, c.category, k.keyword
+    -- another transaction could have refreshed the same day in the meantime
+    ON CONFLICT (web_source, day, category, keyword) DO UPDATE
+    SET
+        vacancies = EXCLUDED.vacancies,
+        salaried_vacancies = EXCLUDED.salaried_vacancies,
+        salary_min = EXCLUDED.salary_min,
+        salary_median = EXCLUDED.salary_median,
+        salary_max = EXCLUDED.salary_max;
+END;
+$$;
+
+-- recomputes the whole skill_stats table
+CREATE OR REPLACE PROCEDURE work_scraper.rebuild_skill_stats()
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    days DATE[];
+    sources INTEGER[];
+BEGIN
+    TRUNCATE work_scraper.skill_stats;
+
+    SELECT array_agg(d.day), array_agg(d.web_source) INTO days, sources
+    FROM (
+        SELECT DISTINCT v.published::DATE AS day, v.web_source
+        FROM work_scraper.vacancies v
+        WHERE v.published IS NOT NULL
+    ) d;
+
+    IF days IS NOT NULL THEN
+        CALL work_scraper.refresh_skill_stats(days, sources);
+    END IF;
+END;
+$$;
+
+-- statement level trigger, refreshes skill_stats of the days and sources of the
+-- inserted, updated or deleted vacancies (once per statement, not per row)
+CREATE OR REPLACE FUNCTION work_scraper.skill_stats_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    days DATE[];
+    sources INTEGER[];
+BEGIN
+    -- transition tables only exist for their own operation, so each
+    -- statement is only planned in its own branch
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(d.day), array_agg(d.web_source) INTO days, sources
+        FROM (
+            SELECT DISTINCT n.published::DATE AS day, n.web_source
+            FROM new_rows n
+            WHERE n.published IS NOT NULL
+        ) d;
+    ELSIF TG_OP = 'UPDATE' THEN
+        -- ignoring updates that don't change the statistics (e.g. touch_vacancies)
+        SELECT array_agg(d.day), array_agg(d.web_source) INTO days, sources
+        FROM (
+            SELECT ch.day, ch.web_source
+            FROM old_rows o
+            JOIN new_rows n ON n.id = o.id
+            CROSS JOIN LATERAL (
+                VALUES (o.published::DATE, o.web_source), (n.published::DATE, n.web_source)
+            ) AS ch(day, web_source)
+            WHERE ch.day IS NOT NULL
+                AND (o.published, o.web_source, o.salary_min, o.salary_max, o.is_hourly_rate, o.summarized_description)
+                IS DISTINCT FROM
+                (n.published, n.web_source, n.salary_min, n.salary_max, n.is_hourly_rate, n.summarized_description)
+            GROUP BY ch.day, ch.web_source
+        ) d;
+    ELSE
+        SELECT array_agg(d.day), array_agg(d.web_source) INTO days, sources
+        FROM (
+            SELECT DISTINCT o.published::DATE AS day, o.web_source
+            FROM old_rows o
+            WHERE o.published IS NOT NULL
+        ) d;
+    END IF;
+
+    IF days IS NOT NULL THEN
+        CALL work_scraper.refresh_skill_stats(days, sources);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS skill_stats_insert ON work_scraper.vacancies;
+CREATE TRIGGER skill_stats_insert
+AFTER INSERT ON work_scraper.vacancies
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION work_scraper.skill_stats_trigger();
+
+DROP TRIGGER IF EXISTS skill_stats_update ON work_scraper.vacancies;
+CREATE TRIGGER skill_stats_update
+AFTER UPDATE ON work_scraper.vacancies
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION work_scraper.skill_stats_trigger();
+
+DROP TRIGGER IF EXISTS skill_stats_delete ON work_scraper.vacancies;
+CREATE TRIGGER skill_stats_delete
+AFTER DELETE ON work_scraper.vacancies
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION work_scraper.skill_stats_trigger();
+
+-- the statistics are recomputed whenever their definition changes
+CALL work_scraper.rebuild_skill_stats();
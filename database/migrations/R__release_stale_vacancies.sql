@@ -0,0 +1,17 @@
+-- used to end the reservation of stale vacancies that the scraper didn't process,
+-- so they can be reserved again right away
+CREATE OR REPLACE PROCEDURE work_scraper.release_stale_vacancies(
+    vacancy_id INTEGER[]
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    curtime TIMESTAMP := now();
+BEGIN
+    UPDATE work_scraper.vacancies
+    SET last_checked = curtime - INTERVAL '5 days',
+        next_check_at = work_scraper.vacancy_next_check(curtime - INTERVAL '5 days', expires)
+    WHERE id = ANY(vacancy_id);
+END;
+$$;
@@ -0,0 +1,14 @@
+-- used to end the reservation of unscanned vacancies that the scraper didn't process,
+-- so they can be reserved again right away
+CREATE OR REPLACE PROCEDURE work_scraper.release_unscanned_vacancies(
+    vacancy_id INTEGER[]
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+    UPDATE work_scraper.unscanned_vacancies
+    SET last_checked = timestamp 'epoch'
+    WHERE id = ANY(vacancy_id);
+END;
+$$;
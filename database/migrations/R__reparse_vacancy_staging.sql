@@ -0,0 +1,73 @@
+-- used to replace the parsed data of existing vacancies with vacancies parsed again from
+-- archived website responses (see scrapers/utils/archive.py), the vacancies must be
+-- in the session's vacancy_staging temporary table (see scrapers/utils/db_connection.py).
+-- Vacancies are matched by their web id, only vacancies whose content hash is the archived one
+-- are updated (newer content wasn't archived), new vacancies aren't inserted and
+-- last_checked/next_check_at are left as they are
+CREATE OR REPLACE PROCEDURE work_scraper.reparse_vacancy_staging(
+    source TEXT
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    source_id INTEGER;
+BEGIN
+    SELECT work_scraper.get_website_id(source) INTO source_id;
+
+    -- handling invalid source input
+    IF source_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- inserting missing employers, countries and cities
+    INSERT INTO work_scraper.employers (title)
+    SELECT DISTINCT s.employer
+    FROM pg_temp.vacancy_staging s
+    WHERE s.employer IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO work_scraper.countries (country_code)
+    SELECT DISTINCT s.country_code
+    FROM pg_temp.vacancy_staging s
+    WHERE s.country_code IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    INSERT INTO work_scraper.cities (city_name)
+    SELECT DISTINCT s.city_name
+    FROM pg_temp.vacancy_staging s
+    WHERE s.city_name IS NOT NULL
+    ON CONFLICT DO NOTHING;
+
+    -- updating existing vacancies
+    UPDATE work_scraper.vacancies v
+    SET
+        title = r.title,
+        employer = r.employer_id,
+        salary_min = r.salary_min,
+        salary_max = r.salary_max,
+        is_hourly_rate = r.is_hourly,
+        remote = r.remote,
+        published = r.published,
+        country = r.country_id,
+        city = r.city_id,
+        description = r.description,
+        summarized_description = r.summarized
+    FROM (
+        SELECT DISTINCT ON (s.vacancy_web_id) -- a row can only be updated once per statement
+            s.*,
+            e.id AS employer_id,
+            co.id AS country_id,
+            ci.id AS city_id
+        FROM pg_temp.vacancy_staging s
+        -- left joins to keep nulls
+        LEFT JOIN work_scraper.employers e ON e.title = s.employer
+        LEFT JOIN work_scraper.countries co ON co.country_code = s.country_code
+        LEFT JOIN work_scraper.cities ci ON ci.city_name = s.city_name
+        ORDER BY s.vacancy_web_id
+    ) r
+    WHERE v.web_source = source_id
+        AND v.vacancy_web_id = r.vacancy_web_id
+        AND v.content_hash = r.content_hash;
+END;
+$$;
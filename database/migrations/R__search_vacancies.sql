@@ -0,0 +1,95 @@
+-- returns up to page_size vacancies, newest first, that require all of the given
+-- programming languages, frameworks and technologies (summarized description keywords,
+-- empty arrays don't filter) and between min_year_exp and max_year_exp years of experience
+-- (NULL doesn't filter). remote_job NULL includes both remote and on-site vacancies.
+-- Paging works the same as in get_vacancies_page
+CREATE OR REPLACE FUNCTION work_scraper.search_vacancies(
+    source TEXT,
+    include_expired BOOLEAN,
+    programming_languages TEXT[],
+    frameworks TEXT[],
+    technologies TEXT[],
+    min_year_exp DOUBLE PRECISION,
+    max_year_exp DOUBLE PRECISION,
+    remote_job BOOLEAN,
+    page_size INTEGER,
+    after_published TIMESTAMP,
+    after_id INTEGER
+)
+RETURNS TABLE(
+    db_id INTEGER,
+    title TEXT,
+    employer_id INTEGER,
+    salary_min DOUBLE PRECISION,
+    salary_max DOUBLE PRECISION,
+    is_hourly_rate BOOLEAN,
+    remote BOOLEAN,
+    published TIMESTAMP,
+    expires TIMESTAMP,
+    country_id INTEGER,
+    city_id INTEGER,
+    vacancy_web_id TEXT,
+    summarized_description JSONB
+)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+AS $$
+DECLARE
+    source_id INTEGER;
+    expiration_filter TIMESTAMP;
+    -- keywords the summarized description has to contain
+    skills JSONB := '{}';
+BEGIN
+    SELECT work_scraper.get_website_id(source) INTO source_id;
+    -- handling invalid source input
+    IF source_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF include_expired = TRUE THEN
+        -- includes expired vacancies
+        expiration_filter := timestamp 'epoch';
+    ELSE
+        expiration_filter := now();
+    END IF;
+
+    IF coalesce(cardinality(programming_languages), 0) > 0 THEN
+        skills := skills || jsonb_build_object('programming_languages', to_jsonb(programming_languages));
+    END IF;
+    IF coalesce(cardinality(frameworks), 0) > 0 THEN
+        skills := skills || jsonb_build_object('frameworks', to_jsonb(frameworks));
+    END IF;
+    IF coalesce(cardinality(technologies), 0) > 0 THEN
+        skills := skills || jsonb_build_object('technologies', to_jsonb(technologies));
+    END IF;
+
+    RETURN QUERY
+    SELECT
+        v.id,
+        v.title,
+        v.employer,
+        v.salary_min,
+        v.salary_max,
+        v.is_hourly_rate,
+        v.remote,
+        v.published,
+        v.expires,
+        v.country,
+        v.city,
+        v.vacancy_web_id,
+        v.summarized_description
+    FROM work_scraper.vacancies v
+    WHERE v.web_source = source_id
+        AND v.expires > expiration_filter
+        AND v.published IS NOT NULL
+        AND (after_id IS NULL OR (v.published, v.id) < (after_published, after_id))
+        -- containment and the year_exp expression are answered by the indexes
+        AND (skills = '{}' OR v.summarized_description @> skills)
+        AND (min_year_exp IS NULL OR (v.summarized_description->>'year_exp')::DOUBLE PRECISION >= min_year_exp)
+        AND (max_year_exp IS NULL OR (v.summarized_description->>'year_exp')::DOUBLE PRECISION <= max_year_exp)
+        AND (remote_job IS NULL OR v.remote IS NULL OR v.remote = remote_job)
+    ORDER BY v.published DESC, v.id DESC
+    LIMIT page_size;
+END;
+$$;
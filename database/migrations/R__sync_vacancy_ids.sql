@@ -0,0 +1,70 @@
+-- used after rescanning the whole vacancy list of a website, the listed web ids
+-- must be in the session's scanned_vacancy_ids temporary table (vacancy_web_id TEXT).
+-- New ids are added to unscanned vacancies, while vacancies that are no longer
+-- listed are marked as expired. Expired vacancies that are listed again (e.g. missed
+-- by a rescan while the list shifted) are checked again right away
+CREATE OR REPLACE PROCEDURE work_scraper.sync_vacancy_ids(
+    source TEXT
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    curtime TIMESTAMP := now();
+    source_id INTEGER;
+BEGIN
+    SELECT work_scraper.get_website_id(source) INTO source_id;
+
+    -- handling invalid source input
+    IF source_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- an empty list means the rescan failed, not that every vacancy is gone
+    IF NOT EXISTS (SELECT 1 FROM pg_temp.scanned_vacancy_ids) THEN
+        RETURN;
+    END IF;
+
+    -- inserting ids that aren't saved yet
+    INSERT INTO work_scraper.unscanned_vacancies (vacancy_web_id, web_source)
+    SELECT s.vacancy_web_id, source_id
+    FROM pg_temp.scanned_vacancy_ids s
+    EXCEPT
+    SELECT v.vacancy_web_id, source_id
+    FROM work_scraper.vacancies v
+    WHERE v.web_source = source_id
+    ON CONFLICT DO NOTHING;
+
+    -- vacancies listed again aren't expired anymore, they are fetched in full again
+    -- (no content hash) by the next stale check, which sets their expiry date
+    UPDATE work_scraper.vacancies v
+    SET expires = NULL,
+        content_hash = NULL,
+        next_check_at = curtime
+    FROM pg_temp.scanned_vacancy_ids s
+    WHERE v.web_source = source_id
+        AND v.vacancy_web_id = s.vacancy_web_id
+        AND v.expires <= curtime;
+
+    -- expiring vacancies that have been removed from the website
+    UPDATE work_scraper.vacancies v
+    SET expires = curtime,
+        next_check_at = work_scraper.vacancy_next_check(v.last_checked, curtime)
+    WHERE v.web_source = source_id
+        AND (v.expires IS NULL OR v.expires > curtime)
+        AND NOT EXISTS (
+            SELECT 1
+            FROM pg_temp.scanned_vacancy_ids s
+            WHERE s.vacancy_web_id = v.vacancy_web_id
+        );
+
+    -- removed vacancies that haven't been scanned yet don't need to be scanned anymore
+    DELETE FROM work_scraper.unscanned_vacancies u
+    WHERE u.web_source = source_id
+        AND NOT EXISTS (
+            SELECT 1
+            FROM pg_temp.scanned_vacancy_ids s
+            WHERE s.vacancy_web_id = u.vacancy_web_id
+        );
+END;
+$$;
@@ -0,0 +1,16 @@
+-- used to mark vacancies as checked when they haven't changed since the last check
+CREATE OR REPLACE PROCEDURE work_scraper.touch_vacancies(
+    vacancy_id INTEGER[]
+)
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+    curtime TIMESTAMP := now();
+BEGIN
+    UPDATE work_scraper.vacancies
+    SET last_checked = curtime,
+        next_check_at = work_scraper.vacancy_next_check(curtime, expires)
+    WHERE id = ANY(vacancy_id);
+END;
+$$;
\ No newline at end of file
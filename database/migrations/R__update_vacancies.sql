@@ -1,4 +1,10 @@
 -- used to update existing vacancies
+DROP PROCEDURE IF EXISTS work_scraper.update_vacancies(
+    INTEGER[], TEXT[], TEXT[], DOUBLE PRECISION[], DOUBLE PRECISION[],
+    BOOLEAN[], BOOLEAN[], TIMESTAMP[], TIMESTAMP[], TEXT[], TEXT[],
+    TEXT[], JSONB[]
+);
+
 CREATE OR REPLACE PROCEDURE work_scraper.update_vacancies(
     vacancy_id INTEGER[],
     title TEXT[],
@@ -12,7 +18,8 @@ CREATE OR REPLACE PROCEDURE work_scraper.update_vacancies(
     country_code TEXT[],
     city_name TEXT[],
     description TEXT[],
-    summarized JSONB[]
+    summarized JSONB[],
+    content_hash TEXT[]
 )
 LANGUAGE plpgsql
 SECURITY DEFINER
@@ -23,6 +30,16 @@ DECLARE
     country_ids INTEGER[];
     city_ids INTEGER[];
 BEGIN
+    -- vacancies with unchanged content, summarized with the same keywords version,
+    -- only get marked as checked, so their description values aren't rewritten
+    UPDATE work_scraper.vacancies AS l
+    SET last_checked = curtime,
+        next_check_at = work_scraper.vacancy_next_check(curtime, l.expires)
+    FROM unnest(vacancy_id, update_vacancies.content_hash, summarized) AS inp(id, content_hash, summarized)
+    WHERE l.id = inp.id
+        AND l.content_hash = inp.content_hash
+        AND l.summarized_description->>'keywords_version' IS NOT DISTINCT FROM inp.summarized->>'keywords_version';
+
     CALL work_scraper.add_employers(employer, emp_ids);
     CALL work_scraper.add_countries(country_code, country_ids);
     CALL work_scraper.add_cities(city_name, city_ids);
@@ -41,8 +58,10 @@ BEGIN
         country = inp.country,
         city = inp.city,
         last_checked = curtime,
+        next_check_at = work_scraper.vacancy_next_check(curtime, inp.expires),
         description = inp.description,
-        summarized_description = inp.summarized
+        summarized_description = inp.summarized,
+        content_hash = inp.content_hash
     FROM (
         -- converting parameters and variables into an array
         SELECT
@@ -58,9 +77,16 @@ BEGIN
             country_ids[i] AS country,
             city_ids[i] AS city,
             description[i] AS description,
-            summarized[i] AS summarized
+            summarized[i] AS summarized,
+            content_hash[i] AS content_hash
         FROM generate_subscripts(vacancy_id, 1) AS i -- positional index for alignment
     ) AS inp
-    WHERE l.id = inp.id;
+    WHERE l.id = inp.id
+        AND (
+            inp.content_hash IS NULL OR
+            l.content_hash IS DISTINCT FROM inp.content_hash OR
+            -- summarized again with other keywords
+            l.summarized_description->>'keywords_version' IS DISTINCT FROM inp.summarized->>'keywords_version'
+            );
 END;
 $$;
\ No newline at end of file
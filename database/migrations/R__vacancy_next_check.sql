@@ -0,0 +1,15 @@
+-- returns when a vacancy checked at last_checked is due for its next check,
+-- NULL if it will have been expired for more than a day by then (it won't be checked again)
+CREATE OR REPLACE FUNCTION work_scraper.vacancy_next_check(
+    last_checked TIMESTAMP,
+    expires TIMESTAMP
+)
+RETURNS TIMESTAMP
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT CASE
+        WHEN expires IS NOT NULL AND last_checked + INTERVAL '5 days' > expires + INTERVAL '24 hours' THEN NULL
+        ELSE last_checked + INTERVAL '5 days'
+    END;
+$$;
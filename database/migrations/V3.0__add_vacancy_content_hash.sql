@@ -0,0 +1,4 @@
+-- hash of the raw vacancy data fetched from the website, used to skip
+-- reprocessing and rewriting vacancies that haven't changed
+ALTER TABLE work_scraper.vacancies
+ADD COLUMN content_hash TEXT;
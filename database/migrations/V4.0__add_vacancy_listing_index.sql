@@ -0,0 +1,4 @@
+-- used by get_vacancies_page, vacancies of a source that haven't expired yet
+-- are read newest first
+CREATE INDEX source_expires_published_index
+ON work_scraper.vacancies (web_source, expires, published);
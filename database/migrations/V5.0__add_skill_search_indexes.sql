@@ -0,0 +1,7 @@
+-- used by search_vacancies, skill containment queries (@>) on the summarized description
+CREATE INDEX summarized_description_index
+ON work_scraper.vacancies USING GIN (summarized_description jsonb_path_ops);
+
+-- used by search_vacancies, required experience range queries
+CREATE INDEX year_exp_index
+ON work_scraper.vacancies (((summarized_description->>'year_exp')::DOUBLE PRECISION));
@@ -0,0 +1,16 @@
+-- vacancy count and salaries per published day, source and summarized description
+-- keyword, maintained by the triggers in R__refresh_skill_stats.sql
+CREATE TABLE work_scraper.skill_stats
+(
+    day                 DATE NOT NULL,
+    web_source          INTEGER NOT NULL
+                        CONSTRAINT skill_stats_web_source_fk REFERENCES work_scraper.sources,
+    category            TEXT NOT NULL, -- summarized description field, e.g. programming_languages
+    keyword             TEXT NOT NULL,
+    vacancies           INTEGER NOT NULL,
+    salaried_vacancies  INTEGER NOT NULL, -- vacancies with a monthly salary
+    salary_min          DOUBLE PRECISION,
+    salary_median       DOUBLE PRECISION, -- median of salary range midpoints
+    salary_max          DOUBLE PRECISION,
+    CONSTRAINT skill_stats_pk PRIMARY KEY (web_source, day, category, keyword)
+);
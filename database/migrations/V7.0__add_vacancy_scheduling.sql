@@ -0,0 +1,27 @@
+-- when a vacancy is due for its next check (last_checked + 5 days), NULL if it won't be checked
+-- again because it will have been expired for more than a day by then.
+-- Maintained by the procedures that change last_checked or expires (see R__vacancy_next_check.sql)
+ALTER TABLE work_scraper.vacancies
+ADD COLUMN next_check_at TIMESTAMP;
+
+UPDATE work_scraper.vacancies
+SET next_check_at = CASE
+    WHEN expires IS NOT NULL AND last_checked + INTERVAL '5 days' > expires + INTERVAL '24 hours' THEN NULL
+    ELSE last_checked + INTERVAL '5 days'
+END;
+
+-- used by get_stale_vacancies, the due vacancies of a source are read oldest due first,
+-- vacancies that won't be checked again aren't indexed
+CREATE INDEX source_next_check_index
+ON work_scraper.vacancies (web_source, next_check_at)
+WHERE next_check_at IS NOT NULL;
+
+-- replaced by source_next_check_index
+DROP INDEX work_scraper.last_checked_index;
+
+-- used by get_unscanned_vacancies, the unreserved vacancies of a source are read oldest first
+CREATE INDEX unscanned_source_last_checked_index
+ON work_scraper.unscanned_vacancies (web_source, last_checked);
+
+-- replaced by unscanned_source_last_checked_index
+DROP INDEX work_scraper.unscanned_last_checked_index;
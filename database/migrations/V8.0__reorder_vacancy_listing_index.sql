@@ -0,0 +1,7 @@
+-- used by get_vacancies_page, a source's vacancies are read in page order (newest first),
+-- expires is filtered by a range, so it's checked in the index entries instead of ordering them
+CREATE INDEX source_published_id_index
+ON work_scraper.vacancies (web_source, published DESC, id DESC, expires);
+
+-- replaced by source_published_id_index, pages had to sort all of a source's unexpired vacancies
+DROP INDEX work_scraper.source_expires_published_index;
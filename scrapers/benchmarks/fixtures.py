@@ -0,0 +1,118 @@
+import hashlib, json, os
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+FIXTURES_DIR: str = os.path.join(os.path.dirname(__file__), "fixtures")
+
+class FixtureStore:
+    """
+    Recorded HTTP responses and the vacancies they belong to, described by manifest.json:\n
+    {"synthetic": bool, "vacancies": [{"source", "web_id", ...}],
+    "responses": {url: {"status", "headers", "file"}}}
+    """
+    def __init__(self, directory: str = FIXTURES_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.manifest: dict = {"synthetic": False, "vacancies": [], "responses": {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+
+    @property
+    def synthetic(self) -> bool:
+        return bool(self.manifest.get("synthetic", False))
+
+    @property
+    def vacancies(self) -> list[dict]:
+        return self.manifest["vacancies"]
+
+    def load(self, url: str) -> tuple[int, dict[str, str], bytes] | None:
+        """
+        Returns: (status code, headers, body) recorded for the url, None if it wasn't recorded
+        """
+        entry = self.manifest["responses"].get(url)
+        if entry is None:
+            return None
+        with open(os.path.join(self.directory, entry["file"]), "rb") as file:
+            return (int(entry["status"]), dict(entry["headers"]), file.read())
+
+    def save(self, url: str, status: int, headers: dict[str, str], body: bytes):
+        """
+        Records a response for the url.
+        """
+        name = f"responses/{hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]}"
+        os.makedirs(os.path.join(self.directory, "responses"), exist_ok=True)
+        with open(os.path.join(self.directory, name), "wb") as file:
+            file.write(body)
+        self.manifest["responses"][url] = {"status": status, "headers": headers, "file": name}
+
+    def add_vacancy(self, vacancy: dict):
+        self.vacancies.append(vacancy)
+
+    def write_manifest(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.manifest_path, "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=2, ensure_ascii=False)
+
+class ReplayAdapter(BaseAdapter):
+    """
+    requests adapter that answers with recorded responses instead of going to the network.
+    Throws ConnectionError for urls that weren't recorded.
+    """
+    def __init__(self, store: FixtureStore):
+        super().__init__()
+        self.store = store
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        recorded = self.store.load(str(request.url))
+        if recorded is None:
+            raise requests.ConnectionError(f"No recorded response for {request.url}", request=request)
+
+        status, headers, body = recorded
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers = CaseInsensitiveDict(headers)
+        resp._content = body
+        resp.encoding = "utf-8"
+        resp.url = str(request.url)
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+class RecordingAdapter(HTTPAdapter):
+    """
+    requests adapter that goes to the network and records every response into the store.
+    """
+    # headers that don't describe the (already decoded) body anymore
+    DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie"}
+
+    def __init__(self, store: FixtureStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        resp = super().send(request, **kwargs)
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in self.DROPPED_HEADERS}
+        self.store.save(str(request.url), resp.status_code, headers, resp.content)
+        return resp
+
+def replay_session(store: FixtureStore) -> requests.Session:
+    """
+    Returns: session that only answers with the store's recorded responses
+    """
+    session = requests.Session()
+    session.mount("https://", ReplayAdapter(store))
+    session.mount("http://", ReplayAdapter(store))
+    return session
+
+def recording_session(store: FixtureStore) -> requests.Session:
+    """
+    Returns: session that records every response into the store
+    """
+    session = requests.Session()
+    session.mount("https://", RecordingAdapter(store))
+    session.mount("http://", RecordingAdapter(store))
+    return session
@@ -0,0 +1,99 @@
+# Compares the description normalization (html removal, punctuation cleanup and experience
+# extraction) against the previous BeautifulSoup/multi-regex implementation.
+# Run from the scrapers directory: python -m benchmarks.normalization [--corpus FILE | --from-db]
+import argparse, json, random, re, time
+from typing import Callable
+from bs4 import BeautifulSoup
+from utils.parser import remove_html_tags, clean_description
+from utils.summarizer import experience_summarizer
+
+def old_remove_html_tags(text: str) -> str:
+    return BeautifulSoup(text, "lxml").text
+
+def old_clean_description(description: str) -> str:
+    description = re.sub(r'[();:,\[\]/{}<>?!.]', ' ', description) # punctuation
+    description = re.sub(r'\s+', ' ', description) # whitespaces
+    return description
+
+def old_experience_summarizer(to_summarize: str) -> float:
+    to_summarize = to_summarize.lower()
+    pattern_en = r'\b(\d+)\+?\s+years?\b'
+    pattern_lv = r'\b(\d+)\+?\s+gad\b'
+    years = [float(match) for match in re.findall(pattern_en, to_summarize)]
+    years += [float(match) for match in re.findall(pattern_lv, to_summarize)]
+    years.sort()
+    return years[-1] if len(years) > 0 else 0
+
+def old_pipeline(description: str) -> tuple[str, float]:
+    # scrapers cleaned the description, then the summarizer cleaned it again
+    cleaned = old_clean_description(old_clean_description(old_remove_html_tags(description)))
+    return (cleaned, old_experience_summarizer(cleaned))
+
+def new_pipeline(description: str) -> tuple[str, float]:
+    cleaned = clean_description(remove_html_tags(description))
+    return (cleaned, experience_summarizer(cleaned))
+
+def synthetic_corpus(size: int) -> list[str]:
+    """
+    Returns: generated html descriptions, NOT real vacancies, only used if no corpus is given
+    """
+    rnd = random.Random(42)
+    words = ["python", "docker", "kubernetes", "izstrādātājs", "pieredze", "experience", "team",
+             "(SQL)", "C#,", "Java/Kotlin", "3+ years", "2 gad", "REST API;", "darbs!", "AWS."]
+    corpus: list[str] = []
+    for _ in range(size):
+        paragraphs = []
+        for _ in range(rnd.randint(3, 12)):
+            text = " ".join(rnd.choice(words) for _ in range(rnd.randint(10, 60)))
+            paragraphs.append(f"<p>{text}</p><ul><li><b>{rnd.choice(words)}</b></li></ul>")
+        corpus.append(f"<div>{"".join(paragraphs)}<script>var a = 1;</script></div>")
+    return corpus
+
+def load_corpus(args: argparse.Namespace) -> tuple[str, list[str]]:
+    """
+    Returns: (corpus name, descriptions)
+    """
+    if args.corpus:
+        # one JSON string (raw description) per line
+        with open(args.corpus, "r", encoding="utf-8") as file:
+            return (args.corpus, [json.loads(line) for line in file if line.strip()])
+    if args.from_db:
+        import utils.db_connection as db
+        conn = db.get_connection()
+        try:
+            descriptions = [r[2] for r in db.iter_vacancy_descriptions(conn, args.source)]
+        finally:
+            db.close_connection(conn)
+        return ("stored descriptions (html already removed)", descriptions)
+    return ("SYNTHETIC", synthetic_corpus(args.size))
+
+def measure(pipeline: Callable[[str], tuple[str, float]], corpus: list[str],
+            repeat: int) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Returns: (best time in seconds out of repeat runs, results)
+    """
+    best = float("inf")
+    results: list[tuple[str, float]] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = [pipeline(d) for d in corpus]
+        best = min(best, time.perf_counter() - started)
+    return (best, results)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark description normalization")
+    parser.add_argument("--corpus", help="file with one JSON encoded raw description per line")
+    parser.add_argument("--from-db", action="store_true", help="use stored descriptions (DB_* environment variables)")
+    parser.add_argument("--source", default=None, help="website of stored descriptions (default: all)")
+    parser.add_argument("--size", type=int, default=2000, help="synthetic corpus size")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    name, corpus = load_corpus(args)
+    old_time, old_results = measure(old_pipeline, corpus, args.repeat)
+    new_time, new_results = measure(new_pipeline, corpus, args.repeat)
+    mismatches = sum(1 for o, n in zip(old_results, new_results) if o != n)
+    print(f"corpus: {name}, {len(corpus)} descriptions, {sum(len(d) for d in corpus)/1e6:.1f} MB")
+    print(f"old: {old_time:.3f}s ({len(corpus)/old_time:.0f} descriptions/s)")
+    print(f"new: {new_time:.3f}s ({len(corpus)/new_time:.0f} descriptions/s)")
+    print(f"speedup: {old_time/new_time:.2f}x, mismatching results: {mismatches}")
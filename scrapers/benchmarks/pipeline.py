@@ -0,0 +1,188 @@
+# Replays recorded website responses through the scraping pipeline and reports
+# per stage latency, throughput and peak memory.
+# Run from the scrapers directory: python -m benchmarks.pipeline [--db] [--baseline FILE]
+import argparse, json, os, statistics, sys, tempfile, time, tracemalloc
+from dataclasses import dataclass, asdict, replace
+from typing import Callable, TypeVar
+import utils.http_client as http
+import utils.db_connection as db
+from utils.keywords import KeywordMatcher
+from utils.ocr import OcrCache, OcrWorker
+from utils.runtime import load_scraper
+from utils.summarizer import create_summarized_description
+from utils.util_classes import Vacancy
+from benchmarks.fixtures import FixtureStore, replay_session, recording_session
+
+T = TypeVar("T")
+SCRAPERS_DIR: str = os.path.join(os.path.dirname(__file__), "..")
+
+@dataclass
+class StageResult:
+    name: str
+    calls: int
+    seconds: float
+    p50_ms: float
+    p95_ms: float
+    throughput: float # calls per second
+    peak_kb: float
+
+def run_stage(name: str, func: Callable[[T], object], items: list[T], iterations: int) -> StageResult:
+    """
+    Calls func for every item, iterations times. Timing is measured first,
+    then peak memory in a separate run under tracemalloc (it slows down the calls).
+    """
+    latencies: list[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for i in items:
+            call_started = time.perf_counter()
+            func(i)
+            latencies.append(time.perf_counter() - call_started)
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    for i in items:
+        func(i)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return StageResult(
+        name=name,
+        calls=len(latencies),
+        seconds=seconds,
+        p50_ms=statistics.median(latencies)*1000 if latencies else 0,
+        p95_ms=latencies[int(len(latencies)*0.95)]*1000 if latencies else 0,
+        throughput=len(latencies)/seconds if seconds > 0 else 0,
+        peak_kb=peak/1024
+    )
+
+def record(store: FixtureStore, cv_lv_ids: list[str], cvvp_ids: list[str], keywords: KeywordMatcher, ocr: OcrWorker):
+    """
+    Fetches the vacancies from the websites (1 request per second) and records the responses.
+    """
+    http.set_session(recording_session(store))
+    store.manifest["synthetic"] = False
+    if len(cv_lv_ids) > 0:
+        cv_lv = load_scraper("cv-lv")
+        nextjs_url = cv_lv.get_nextjs_url()
+        for web_id in cv_lv_ids:
+            time.sleep(1)
+            cv_lv.get_vacancy_data(nextjs_url, web_id, 0, keywords, ocr)
+            store.add_vacancy({"source": "cv.lv", "web_id": web_id, "nextjs_url": nextjs_url})
+    if len(cvvp_ids) > 0:
+        cvvp = load_scraper("cvvp-nva-gov-lv")
+        for web_id in cvvp_ids:
+            time.sleep(1)
+            cvvp.get_vacancy_data(web_id, 0, keywords)
+            store.add_vacancy({"source": "cvvp.nva.gov.lv", "web_id": web_id})
+    store.write_manifest()
+
+def benchmark(store: FixtureStore, keywords: KeywordMatcher, ocr: OcrWorker,
+              iterations: int, with_db: bool) -> list[StageResult]:
+    """
+    Runs every pipeline stage over the recorded vacancies.\n
+    Returns: results of each stage
+    """
+    http.set_session(replay_session(store))
+    results: list[StageResult] = []
+    fetched: dict[str, list[Vacancy]] = {}
+
+    cv_lv_fixtures = [v for v in store.vacancies if v["source"] == "cv.lv"]
+    if len(cv_lv_fixtures) > 0:
+        cv_lv = load_scraper("cv-lv")
+        fetch = lambda v: cv_lv.get_vacancy_data(v["nextjs_url"], v["web_id"], 0, keywords, ocr)
+        results.append(run_stage("get_vacancy_data (cv.lv)", fetch, cv_lv_fixtures, iterations))
+        fetched["cv.lv"] = [fetch(v) for v in cv_lv_fixtures]
+
+    cvvp_fixtures = [v for v in store.vacancies if v["source"] == "cvvp.nva.gov.lv"]
+    if len(cvvp_fixtures) > 0:
+        cvvp = load_scraper("cvvp-nva-gov-lv")
+        fetch = lambda v: cvvp.get_vacancy_data(v["web_id"], 0, keywords)
+        results.append(run_stage("get_vacancy_data (cvvp.nva.gov.lv)", fetch, cvvp_fixtures, iterations))
+        fetched["cvvp.nva.gov.lv"] = [fetch(v) for v in cvvp_fixtures]
+
+    vacancies = [v for vl in fetched.values() for v in vl]
+    results.append(run_stage(
+        "create_summarized_description",
+        lambda v: create_summarized_description(f" {v.title} {v.description} ", keywords),
+        vacancies, iterations
+    ))
+    results.append(run_stage("convert_vacancies_to_columns", db.convert_vacancies_to_columns, [vacancies], iterations))
+
+    if with_db:
+        conn = db.get_connection()
+        try:
+            # separate web ids, so real vacancies aren't overwritten
+            batches = [
+                (source, [replace(v, web_id=f"benchmark-{v.web_id}") for v in vl])
+                for source, vl in fetched.items()
+            ]
+            results.append(run_stage(
+                "add_new_vacancies", lambda b: db.add_new_vacancies(conn, b[0], b[1]), batches, iterations
+            ))
+            results.append(run_stage(
+                "bulk_upsert_vacancies", lambda b: db.bulk_upsert_vacancies(conn, b[0], b[1], only_changed=False),
+                batches, iterations
+            ))
+        finally:
+            db.close_connection(conn)
+
+    return results
+
+def find_regressions(results: list[StageResult], baseline: dict[str, dict], threshold: float) -> list[str]:
+    """
+    Returns: descriptions of stages whose throughput dropped or peak memory grew by more than threshold
+    """
+    regressions: list[str] = []
+    for r in results:
+        base = baseline.get(r.name)
+        if not base:
+            continue
+        if r.throughput < base["throughput"]*(1-threshold):
+            regressions.append(f"{r.name}: throughput {r.throughput:.0f}/s, baseline {base["throughput"]:.0f}/s")
+        if r.peak_kb > base["peak_kb"]*(1+threshold):
+            regressions.append(f"{r.name}: peak memory {r.peak_kb:.0f} KB, baseline {base["peak_kb"]:.0f} KB")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraping pipeline using recorded responses")
+    parser.add_argument("--fixtures", default=None, help="fixtures directory (default: benchmarks/fixtures)")
+    parser.add_argument("--keywords", default=os.path.join(SCRAPERS_DIR, "..", "keywords.json"), help="keywords.json path")
+    parser.add_argument("--iterations", type=int, default=50, help="how many times every fixture is replayed")
+    parser.add_argument("--db", action="store_true", help="also benchmark the database procedures (DB_* environment variables, use a throwaway database)")
+    parser.add_argument("--output", help="write the results to this JSON file (can be used as a baseline)")
+    parser.add_argument("--baseline", help="fail if a stage regressed compared to this results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression, 0.2 = 20%%")
+    parser.add_argument("--record", action="store_true", help="fetch the vacancies from the websites and record them as fixtures")
+    parser.add_argument("--cv-lv-ids", default="", help="comma separated cv.lv vacancy ids to record")
+    parser.add_argument("--cvvp-ids", default="", help="comma separated cvvp.nva.gov.lv vacancy ids to record")
+    args = parser.parse_args()
+
+    with open(args.keywords, "r") as file:
+        keywords = KeywordMatcher(json.load(file))
+    store = FixtureStore(args.fixtures) if args.fixtures else FixtureStore()
+    ocr = OcrWorker(OcrCache(tempfile.mkdtemp(prefix="ocr-bench-"), 64*1024*1024), 1)
+    try:
+        if args.record:
+            record(store, [i for i in args.cv_lv_ids.split(",") if i], [i for i in args.cvvp_ids.split(",") if i], keywords, ocr)
+            print(f"Recorded {len(store.vacancies)} vacancies into {store.directory}")
+            sys.exit(0)
+        results = benchmark(store, keywords, ocr, args.iterations, args.db)
+    finally:
+        ocr.close()
+
+    print(f"fixtures: {store.directory} ({"SYNTHETIC" if store.synthetic else "recorded"}, {len(store.vacancies)} vacancies)")
+    print(f"{"stage":<36}{"calls":>8}{"p50 ms":>10}{"p95 ms":>10}{"calls/s":>12}{"peak KB":>10}")
+    for r in results:
+        print(f"{r.name:<36}{r.calls:>8}{r.p50_ms:>10.3f}{r.p95_ms:>10.3f}{r.throughput:>12.0f}{r.peak_kb:>10.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({r.name: asdict(r) for r in results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            regressions = find_regressions(results, json.load(file), args.threshold)
+        for reg in regressions:
+            print(f"REGRESSION {reg}")
+        sys.exit(1 if len(regressions) > 0 else 0)
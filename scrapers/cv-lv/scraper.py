@@ -1,32 +1,52 @@
-import requests
+import utils.archive as archive
+import utils.http_client as http
 from utils.util_classes import Vacancy
-import utils.db_connection as db
+from utils.keywords import KeywordMatcher
+import utils.metrics as metrics
 import utils.summarizer as summary
-from utils.util_funcs import get_random
+from utils.fetcher import RateLimiter
+from utils.runtime import Source, FetchDeferredError, run_sources, load_settings
+from utils.util_funcs import get_content_hash
 import datetime as dt
-import time, os, json
-from utils.parser import parse_image_file_to_string, remove_html_tags, clean_description
+import os, threading, time
+import ijson
+from typing import Iterable, Iterator
+from utils.parser import remove_html_tags
+from utils.ocr import OcrCache, OcrWorker
 
 DOMAIN: str = "cv.lv"
 
-def get_vacancies_list() -> list[str]:
+def get_vacancies_list(page_size: int = 0, limiter: RateLimiter | None = None) -> Iterator[str]:
     """
-    Returns a list of all available vacancies (only their ids)
+    Yields ids of all available IT vacancies, parsing the search response as it's downloaded.
+    If page_size is 0, a single request of 10000 listings is made, otherwise the search
+    is paged (waiting for the rate limiter, if given, before each page).
     """
-    # simple get request of 10000 listings is enough to get all of them
-    vacancies_req = requests.get("https://cv.lv/api/v1/vacancy-search-service/search?limit=10000&offset=0")
-    if not vacancies_req.ok:
-        raise Exception(f"Couldn't get vacancies list! Error code: {vacancies_req.status_code}")
-    
-    vac_json = vacancies_req.json()
-    final: list[str] = []
-    for v in vac_json["vacancies"]:
-        if not 10 in v["categories"]:
-            # vacancy doesnt have "INFORMATION_TECHNOLOGY" tag, skipping
-            continue
-        final.append(str(v["id"]))
+    limit: int = page_size if page_size > 0 else 10000
+    offset: int = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        with http.get(
+            f"https://cv.lv/api/v1/vacancy-search-service/search?limit={limit}&offset={offset}",
+            stream=True
+        ) as vacancies_req:
+            if not vacancies_req.ok:
+                raise Exception(f"Couldn't get vacancies list! Error code: {vacancies_req.status_code}")
+
+            vacancies_req.raw.decode_content = True # gzip/br decoding
+            listed: int = 0
+            for v in ijson.items(vacancies_req.raw, "vacancies.item"):
+                listed += 1
+                if not 10 in v["categories"]:
+                    # vacancy doesnt have "INFORMATION_TECHNOLOGY" tag, skipping
+                    continue
+                yield str(v["id"])
 
-    return final
+        if page_size <= 0 or listed < limit:
+            # a single request of 10000 listings is enough to get all of them, or it was the last page
+            return
+        offset += listed
 
 def get_nextjs_url() -> str:
     """
@@ -34,7 +54,7 @@ def get_nextjs_url() -> str:
     /_next/data/[url]/lv/vacancy/[vacancyId]/a/a.json?params=[vacancyId] \n
     Returns: [url] part to use within link
     """
-    html_req = requests.get("https://cv.lv/lv/search?limit=20&offset=0&fuzzy=true")
+    html_req = http.get("https://cv.lv/lv/search?limit=20&offset=0&fuzzy=true")
     if not html_req.ok:
         raise Exception("Couldn't fetch vacancy search html!")
     
@@ -50,21 +70,176 @@ def get_nextjs_url() -> str:
         raise Exception("Couldn't find nextjs url! (end)")
     
     return sanitized[index_start+len(search_start_tag):index_end]
+
+def index_locations(loc_json: dict) -> tuple[dict[str, dict], dict[int, dict]]:
+    """
+    Returns: (countries by id, towns by id) of the locations in a vacancy data response
+    """
+    return (dict(loc_json["countries"]), {t["id"]: t for t in loc_json["towns"]})
+
+class VacancyNotFoundError(Exception):
+    """
+    The vacancy data request returned 404, either the vacancy was removed
+    or the nextjs url (build id) has changed.
+    """
+
+class CvLvMetadata:
+    """
+    Website metadata shared by all vacancy fetches: the nextjs url, kept until a vacancy data
+    request returns 404, and the countries and towns by id, replaced by the ones in a
+    vacancy data response every locations_ttl seconds (or when an id is missing).
+    The nextjs url is discovered by a single thread at a time, without holding the lock.
+    """
+    def __init__(self, locations_ttl: float = 3600, rediscover_after: float = 600):
+        self.locations_ttl = locations_ttl
+        self.rediscover_after = rediscover_after
+        self.nextjs_url: str | None = None
+        # time.monotonic() a 404 was last found not to be caused by a changed nextjs url,
+        # None once a vacancy has been fetched with the nextjs url since
+        self.verified: float | None = None
+        self.discovering: threading.Event | None = None # set once the running discovery ends
+        self.countries: dict[str, dict] = {}
+        self.towns: dict[int, dict] = {}
+        self.indexed: float = 0 # time.monotonic() of the last location indexing
+        self.lock = threading.Lock()
+
+    def get_nextjs_url(self, limiter: RateLimiter | None = None) -> str:
+        """
+        Returns the cached nextjs url. If it isn't known, it's discovered (waiting for the limiter, if given),
+        threads asking meanwhile wait for that discovery. Throws an exception if the discovery failed.
+        """
+        with self.lock:
+            if self.nextjs_url is not None:
+                return self.nextjs_url
+            running = self.discovering
+            if running is None:
+                self.discovering = threading.Event()
+
+        if running:
+            running.wait()
+            with self.lock:
+                if self.nextjs_url is None:
+                    raise Exception("Couldn't discover nextjs url!")
+                return self.nextjs_url
+
+        nextjs_url: str | None = None
+        try:
+            if limiter:
+                limiter.acquire()
+            nextjs_url = get_nextjs_url()
+        finally:
+            with self.lock:
+                if nextjs_url is not None:
+                    self.nextjs_url = nextjs_url
+                self.discovering.set()
+                self.discovering = None
+        return nextjs_url
+
+    def nextjs_url_worked(self, nextjs_url: str):
+        """
+        Called when a vacancy was fetched using nextjs_url.
+        """
+        with self.lock:
+            if self.nextjs_url == nextjs_url:
+                self.verified = None
+
+    def nextjs_url_failed(self, nextjs_url: str, limiter: RateLimiter | None = None) -> bool:
+        """
+        Called when a vacancy data request using nextjs_url returned 404 (a removed vacancy returns 404 too),
+        the nextjs url is discovered again. Throws FetchDeferredError instead if a 404 already didn't change
+        it within rediscover_after seconds and no vacancy has been fetched since, the website could have
+        been updated after that discovery, so the vacancy isn't known to be removed.\n
+        Returns: True if the nextjs url has changed and the request should be retried
+        """
+        with self.lock:
+            if self.nextjs_url == nextjs_url:
+                if self.verified is not None and time.monotonic() - self.verified < self.rediscover_after:
+                    raise FetchDeferredError(f"nextjs url {nextjs_url} was checked recently, vacancy data could be missing because of a website update")
+                self.nextjs_url = None
+        changed = self.get_nextjs_url(limiter) != nextjs_url
+        with self.lock:
+            self.verified = None if changed else time.monotonic()
+        return changed
+
+    def get_location(self, loc_json: dict, country_id, town_id) -> tuple[dict, dict | None]:
+        """
+        Returns: (country, town) of the vacancy, town is None if it isn't known
+        """
+        with self.lock:
+            countries, towns = self.countries, self.towns
+            outdated = time.monotonic() - self.indexed > self.locations_ttl
+        if outdated or str(country_id) not in countries or (town_id is not None and town_id not in towns):
+            countries, towns = index_locations(loc_json)
+            with self.lock:
+                self.countries, self.towns = countries, towns
+                self.indexed = time.monotonic()
+        return (countries[str(country_id)], towns.get(town_id))
     
+@metrics.timed_function(metrics.STAGE_SECONDS, stage="get_vacancy_data")
 def get_vacancy_data(nextjs_url: str, web_id: str, db_id: int,
-                     keywords_json: dict[str, dict[str, list[str]]]) -> Vacancy:
+                     keywords: KeywordMatcher, ocr: OcrWorker, refresh: bool = False,
+                     known_hash: str | None = None, metadata: CvLvMetadata | None = None) -> Vacancy:
     """
-    Gets detailed data about a vacancy, throws an exception if couldn't fetch data.\n
+    Gets detailed data about a vacancy, throws an exception if couldn't fetch data
+    (VacancyNotFoundError if the website returned 404).
+    If refreshing, throws NotModifiedError if the vacancy hasn't changed since the last fetch
+    or its content hash is the same as known_hash. If metadata is given, its cached
+    locations are used.\n
     Returns: Vacancy with nearly all data up to date
     """
     #mezd8hB2BMdFAOGky93ai
-    vacancy_req = requests.get(f"https://cv.lv/_next/data/{nextjs_url}/lv/vacancy/{web_id}/a/a.json?params={web_id}")
+    url = f"https://cv.lv/_next/data/{nextjs_url}/lv/vacancy/{web_id}/a/a.json?params={web_id}"
+    vacancy_req = http.get(url, conditional=refresh)
+    if vacancy_req.status_code == 404:
+        raise VacancyNotFoundError(f"Vacancy data for {web_id} not found using nextjs url {nextjs_url}")
     if not vacancy_req.ok:
         raise Exception(f"Couldn't fetch vacancy data for {web_id} using nextjs url {nextjs_url}")
+    if metadata:
+        metadata.nextjs_url_worked(nextjs_url)
     
     jsonified = vacancy_req.json()
     vac_json = jsonified["pageProps"]["vacancy"][web_id]
     loc_json = jsonified["pageProps"]["locations"]
+    content_hash = get_content_hash(vac_json)
+    if refresh and content_hash == known_hash:
+        http.validators.remember(url, vacancy_req) # the saved vacancy is the same
+        raise http.NotModifiedError(f"Vacancy {web_id} content hasn't changed")
+
+    # only the vacancy's own country and town are kept from the locations
+    location = vac_json["highlights"]["location"]
+    if metadata:
+        country, town = metadata.get_location(loc_json, location["countryId"], location["townId"])
+    else:
+        countries, towns = index_locations(loc_json)
+        country, town = countries[str(location["countryId"])], towns.get(location["townId"])
+    file_text = get_file_text(vac_json, web_id, ocr)
+    archive.record(DOMAIN, web_id, vac_json, country=country, town=town, file_text=file_text)
+    vacancy = parse_vacancy(vac_json, country, town, file_text, web_id, db_id, keywords, content_hash)
+    http.validators.stage(DOMAIN, web_id, url, vacancy_req)
+    return vacancy
+
+def get_file_text(vac_json: dict, web_id: str, ocr: OcrWorker) -> str | None:
+    """
+    Reads the text of a vacancy described using an image.\n
+    Returns: text of the image, None if the vacancy has no image or it couldn't be fetched
+    """
+    if not vac_json["details"]["fileDetails"]:
+        return None
+    file_id = str(vac_json["details"]["fileDetails"]["fileId"])
+    file_req = http.get(f"https://cv.lv/api/v1/files-service/{file_id}")
+    if not file_req.ok:
+        metrics.log("Couldn't get file description", source=DOMAIN, web_id=web_id, file_id=file_id)
+        return None
+    languages = [v["iso"] for v in vac_json["languages"]]
+    return ocr.parse(file_id, file_req.content, lv_enabled=("lv" in languages), en_enabled=("en" in languages))
+
+def parse_vacancy(vac_json: dict, country: dict, town: dict | None, file_text: str | None,
+                  web_id: str, db_id: int, keywords: KeywordMatcher, content_hash: str) -> Vacancy:
+    """
+    Parses and summarizes the vacancy json, using its country and town from the locations
+    and the text of its image description (if any).\n
+    Returns: Vacancy with nearly all data up to date
+    """
     # getting summarized info about the vacancy
     summed_description: str = ""
     summed_description += f" {vac_json["position"]} "
@@ -87,36 +262,22 @@ def get_vacancy_data(nextjs_url: str, web_id: str, db_id: int,
         for d in vac_json["details"]["standardDetails"]:
             if d["content"]:
                 base_desc += f" {d["content"]} "
-    if vac_json["details"]["fileDetails"]:
+    if file_text is not None:
         # vacancy is described using an image
-        file_req = requests.get(f"https://cv.lv/api/v1/files-service/{vac_json["details"]["fileDetails"]["fileId"]}")
-        if not file_req.ok:
-            print(f"Couldn't get file description for {web_id} for filename {vac_json["details"]["fileDetails"]["fileId"]}")
-        else:
-            fetched_type = file_req.headers["content-type"]
-            img_type: str = fetched_type[fetched_type.find("/")+1:]
-            filename: str = f"image_description.{img_type}"
-            with open(filename, "wb") as img_file:
-                img_file.write(file_req.content)
-
-            parsed = parse_image_file_to_string(filename, lv_enabled=("lv" in languages), en_enabled=("en" in languages))
-            base_desc += f" {parsed} "
+        base_desc += f" {file_text} "
             
     try:
         base_desc = remove_html_tags(base_desc)
     except Exception as e:
-        print(f"Failed to remove html tags from base description!", e)
-    summed_description += f" {clean_description(base_desc)} "
+        metrics.log("Failed to remove html tags from base description!", source=DOMAIN, error=repr(e))
+    summed_description += f" {base_desc} " # cleaned while summarizing
 
-    summarized = summary.create_summarized_description(summed_description, keywords_json)
+    summarized = summary.create_summarized_description(summed_description, keywords)
     summarized.languages = languages
 
     # Creating final vacancy
-    cc: str = str(loc_json["countries"][
-        str(vac_json["highlights"]["location"]["countryId"])
-    ]["iso"])
-    city_matches = [t for t in loc_json["towns"] if t["id"] == vac_json["highlights"]["location"]["townId"]]
-    city: str | None = str(city_matches[0]["name"]) if len(city_matches) > 0 else None
+    cc: str = str(country["iso"])
+    city: str | None = str(town["name"]) if town else None
     s_min: float = 0
     s_max: float = 0
     if vac_json["highlights"]["salaryFrom"]:
@@ -140,114 +301,68 @@ def get_vacancy_data(nextjs_url: str, web_id: str, db_id: int,
         city_name=city,
         web_id=web_id,
         description=base_desc.strip(),
-        summarized_description=summarized
+        summarized_description=summarized,
+        content_hash=content_hash
     )
 
-
-if __name__ == "__main__":
-    # Load environment variables
-    web_req_interval = (
-        float(os.getenv("WEB_REQUEST_INTERVAL_MIN", "0.5")),
-        float(os.getenv("WEB_REQUEST_INTERVAL_MAX", "1.0"))
+def parse_archived(web_id: str, payload: dict, extra: dict, keywords: KeywordMatcher) -> Vacancy:
+    """
+    Parses a vacancy saved by utils.archive again (archive replay), the image
+    description isn't read again, its archived text is used.\n
+    Returns: Vacancy without a database id
+    """
+    return parse_vacancy(
+        payload, extra["country"], extra["town"], extra["file_text"],
+        web_id, 0, keywords, get_content_hash(payload)
     )
-    db_req_interval = float(os.getenv("DB_REQUEST_INTERVAL", "3.0"))
-    nothing_todo_interval = float(os.getenv("NOTHING_TODO_INTERVAL", "60.0"))
 
-    # Reading keywords.json
-    keywords_json: dict[str, dict[str, list[str]]] = {}
-    with open("/keywords.json", "r") as file:
-        keywords_json: dict[str, dict[str, list[str]]] = json.load(file)
+class CvLvSource(Source):
+    domain = DOMAIN
 
-    db_con = None
-    # main loop
-    while True:
-        if not db_con:
-            db_con = db.get_connection()
-        # updating website vacancy list if its outdated
-        website_stale = db.check_if_website_stale(db_con, DOMAIN)
-        if website_stale:
-            print(f"[{dt.datetime.now().isoformat()}] Website stale, rescanning...!")
-            db.set_website_scan_status(db_con, DOMAIN, True)
-            vacancy_list: list[str] = []
-            try:
-                vacancy_list = get_vacancies_list()
-            except Exception as e:
-                print(f"[{dt.datetime.now().isoformat()}] An exception occoured while getting vacancy list!", e)
-            
-            # Adding vacancies to the database
-            try:
-                # splitting into chunks of 500 vacancies per insert
-                chunks = [
-                    vacancy_list[i:i + 500]
-                    for i in range(0, len(vacancy_list), 500)
-                ]
-
-                # inserting new vacancies into database
-                for c in chunks:
-                    db.add_unscanned_vacancies(db_con, c, DOMAIN)
-            except Exception as e:
-                print(f"[{dt.datetime.now().isoformat()}] An exception occoured while adding unscanned vacancies to database!", e)
-            finally:
-                db.set_website_scan_status(db_con, DOMAIN, False)
-            print(f"[{dt.datetime.now().isoformat()}] Website rescanned!")
-            time.sleep(db_req_interval) # letting database rest a little
-
-        
-        # Updating unscanned & stale vacancy info
-        nextjs_url: str = ""
+    def __init__(self, list_page_size: int, ocr: OcrWorker, metadata: CvLvMetadata):
+        self.list_page_size = list_page_size
+        self.ocr = ocr
+        self.metadata = metadata
+
+    def list_ids(self, limiter: RateLimiter, max_concurrency: int) -> Iterable[str]:
+        # pages are requested one after another, the list is parsed while downloading
+        return get_vacancies_list(self.list_page_size, limiter)
+
+    def prepare(self):
+        # only requests the website if the nextjs url isn't known yet
+        self.metadata.get_nextjs_url(self.limiter)
+
+    def fetch_detail(self, web_id: str, db_id: int, keywords: KeywordMatcher,
+                     refresh: bool = False, known_hash: str | None = None) -> Vacancy:
+        nextjs_url = self.metadata.get_nextjs_url(self.limiter)
         try:
-            nextjs_url = get_nextjs_url()
-        except:
-            # failed to get nextjs url
-            db.close_connection(db_con)
-            db_con = None
-            time.sleep(nothing_todo_interval) # max wait time, since this is a big error
-            continue
-
-        unscanned_vacancies = db.get_unscanned_vacancies(db_con, DOMAIN)
-        if len(unscanned_vacancies) > 0:
-            # There are unscanned vacancies to process first
-            print(f"[{dt.datetime.now().isoformat()}] Fetching info for {len(unscanned_vacancies)} unscanned vacancies...")
-            fetched: list[Vacancy] = []
-            for sv in unscanned_vacancies:
-                try:
-                    data = get_vacancy_data(nextjs_url, sv[0], sv[1], keywords_json)
-                    fetched.append(data)
-                except Exception as e:
-                    print(f"[{dt.datetime.now().isoformat()}] Failed to get vacancy data for {sv[0]}", e)
-                
-                time.sleep(get_random(web_req_interval[0], web_req_interval[1])) # delay between requests
-            print(f"[{dt.datetime.now().isoformat()}] Unscanned vacancy info fetched!")
-            db.add_new_vacancies(db_con, DOMAIN, fetched)
-            ids: list[int] = [i[1] for i in unscanned_vacancies]
-            db.delete_unscanned_vacancies(db_con, ids)
-            time.sleep(db_req_interval) # letting database rest a little
-
-
-        # getting stale vacancies to update their info
-        stale_vacancies = db.get_stale_vacancies(db_con, DOMAIN)
-        if len(stale_vacancies) == 0:
-            if len(unscanned_vacancies) == 0:
-                db.close_connection(db_con)
-                db_con = None
-                time.sleep(nothing_todo_interval)
-            else:
-                time.sleep(get_random(web_req_interval[0], web_req_interval[1]))
-            continue
-
-        # Fetching full info for stale vacancies
-        print(f"[{dt.datetime.now().isoformat()}] Fetching info for {len(stale_vacancies)} stale vacancies...")
-        fetched: list[Vacancy] = []
-        for sv in stale_vacancies:
-            try:
-                data = get_vacancy_data(nextjs_url, sv[0], sv[1], keywords_json)
-                fetched.append(data)
-            except Exception as e:
-                print(f"[{dt.datetime.now().isoformat()}] Failed to get vacancy data for {sv[0]}", e)
-            
-            time.sleep(get_random(web_req_interval[0], web_req_interval[1])) # delay between requests
-        print(f"[{dt.datetime.now().isoformat()}] Vacancy info fetched!")
-        # Performing update
-        db.update_vacancies(db_con, fetched)
-        time.sleep(db_req_interval) # Letting database rest a little
-        time.sleep(get_random(web_req_interval[0], web_req_interval[1]))
\ No newline at end of file
+            return get_vacancy_data(nextjs_url, web_id, db_id, keywords, self.ocr, refresh, known_hash, self.metadata)
+        except VacancyNotFoundError:
+            if not self.metadata.nextjs_url_failed(nextjs_url, self.limiter):
+                raise
+        # the website was updated, retrying with the new nextjs url (an extra request, so it waits for a slot)
+        if self.limiter:
+            self.limiter.acquire()
+        return get_vacancy_data(self.metadata.get_nextjs_url(self.limiter), web_id, db_id, keywords, self.ocr, refresh, known_hash, self.metadata)
+
+    def close(self):
+        self.ocr.close()
+
+def create_source() -> CvLvSource:
+    """
+    Returns: cv.lv source configured from the environment variables
+    """
+    list_page_size = int(os.getenv("CV_LV_LIST_PAGE_SIZE", "0"))
+    ocr_cache_dir = os.getenv("OCR_CACHE_DIR", "/app/ocr_cache")
+    ocr_cache_size = int(os.getenv("OCR_CACHE_MAX_MB", "256"))*1024*1024
+    ocr_workers = int(os.getenv("OCR_WORKERS", "2"))
+    ocr_timeout = float(os.getenv("OCR_TIMEOUT", "60.0"))
+    locations_ttl = float(os.getenv("CV_LV_LOCATIONS_TTL", "3600"))
+    return CvLvSource(
+        list_page_size, OcrWorker(OcrCache(ocr_cache_dir, ocr_cache_size), ocr_workers, ocr_timeout),
+        CvLvMetadata(locations_ttl)
+    )
+
+
+if __name__ == "__main__":
+    run_sources([create_source()], load_settings())
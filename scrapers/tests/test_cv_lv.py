@@ -0,0 +1,59 @@
+import unittest
+from unittest import mock
+from utils.runtime import load_scraper, FetchDeferredError
+
+scraper = load_scraper("cv-lv")
+
+class NextjsUrlTest(unittest.TestCase):
+    def setUp(self):
+        self.urls = ["build-1"]
+        self.discoveries: int = 0
+        patcher = mock.patch.object(scraper, "get_nextjs_url", self.discover)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def discover(self) -> str:
+        # the website's current build id
+        self.discoveries += 1
+        return self.urls[-1]
+
+    def test_changed_url_is_discovered_right_after_a_discovery(self):
+        metadata = scraper.CvLvMetadata()
+        self.assertEqual(metadata.get_nextjs_url(), "build-1")
+        self.urls.append("build-2") # deployed right away
+        self.assertTrue(metadata.nextjs_url_failed("build-1"))
+        self.assertEqual(metadata.get_nextjs_url(), "build-2")
+
+    def test_removed_vacancy(self):
+        metadata = scraper.CvLvMetadata()
+        metadata.get_nextjs_url()
+        self.assertFalse(metadata.nextjs_url_failed("build-1"))
+        self.assertEqual(self.discoveries, 2)
+
+    def test_repeated_404s_are_deferred(self):
+        metadata = scraper.CvLvMetadata()
+        metadata.get_nextjs_url()
+        self.assertFalse(metadata.nextjs_url_failed("build-1"))
+        # nothing was fetched since the check, the website could have been updated after it
+        self.urls.append("build-2")
+        with self.assertRaises(FetchDeferredError):
+            metadata.nextjs_url_failed("build-1")
+        self.assertEqual(self.discoveries, 2)
+
+    def test_404_after_a_fetch_is_checked(self):
+        metadata = scraper.CvLvMetadata()
+        metadata.get_nextjs_url()
+        self.assertFalse(metadata.nextjs_url_failed("build-1"))
+        metadata.nextjs_url_worked("build-1")
+        self.assertFalse(metadata.nextjs_url_failed("build-1"))
+        self.assertEqual(self.discoveries, 3)
+
+    def test_404_is_checked_again_after_rediscover_after(self):
+        metadata = scraper.CvLvMetadata(rediscover_after=0)
+        metadata.get_nextjs_url()
+        self.assertFalse(metadata.nextjs_url_failed("build-1"))
+        self.urls.append("build-2")
+        self.assertTrue(metadata.nextjs_url_failed("build-1"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import os, unittest
+import datetime as dt
+import utils.db_connection as db
+from utils.util_classes import Vacancy, VacancyBatch, SummarizedDescription, PendingWrite
+
+# procedure tests run against a migrated database (DB_HOST, DB_PORT, DB_SCRAPER_USER, DB_SCRAPER_PASSWORD),
+# the user must be able to read the tables. They are skipped unless TEST_DB_NAME is set, never use a production database
+TEST_DB_NAME: str = os.getenv("TEST_DB_NAME", "")
+SOURCE: str = "cv.lv"
+
+def summary(keywords_version: str | None) -> SummarizedDescription:
+    return SummarizedDescription(["lv"], [], 0, [], [], ["python"], [], keywords_version)
+
+@unittest.skipUnless(TEST_DB_NAME, "TEST_DB_NAME isn't set")
+class DatabaseTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # also used by the connection pool (VacancyWriter)
+        os.environ["DB_NAME"] = TEST_DB_NAME
+
+    def setUp(self):
+        self.conn = db.pg.connect(**db.connection_params())
+        self.web_ids: list[str] = []
+
+    def tearDown(self):
+        self.conn.rollback() # a failed test can leave the transaction aborted
+        cur = self.conn.cursor()
+        for table in ("vacancies", "unscanned_vacancies"):
+            cur.execute(
+                f"""DELETE FROM work_scraper.{table}
+                WHERE web_source = work_scraper.get_website_id(%s) AND vacancy_web_id = ANY(%s)""",
+                (SOURCE, self.web_ids)
+            )
+        self.conn.commit()
+        cur.close()
+        self.conn.close()
+
+    def add_vacancy(self, web_id: str, **values) -> Vacancy:
+        """
+        Adds a vacancy with the given column values, returns it with its row id.
+        """
+        v = Vacancy(web_id=web_id, title="Python developer", description="Python", **values)
+        self.web_ids.append(web_id)
+        db.add_new_vacancies(self.conn, SOURCE, [v])
+        v.db_id = self.fetch_one("SELECT id FROM work_scraper.vacancies WHERE vacancy_web_id = %s", (web_id,))[0]
+        return v
+
+    def fetch_one(self, query: str, params: tuple) -> tuple:
+        cur = self.conn.cursor()
+        cur.execute(query, params)
+        row = cur.fetchone()
+        self.conn.commit()
+        cur.close()
+        return row
+
+class UpdateVacanciesTest(DatabaseTest):
+    def stored(self, v: Vacancy) -> tuple:
+        return self.fetch_one(
+            """SELECT title, summarized_description->>'keywords_version'
+            FROM work_scraper.vacancies WHERE id = %s""",
+            (v.db_id,)
+        )
+
+    def test_unchanged_content_is_only_touched(self):
+        v = self.add_vacancy("test-unchanged", summarized_description=summary("v1"), content_hash="hash")
+        v.title = "not saved"
+        db.update_vacancies(self.conn, [v])
+        self.assertEqual(self.stored(v), ("Python developer", "v1"))
+
+    def test_unchanged_content_with_other_keywords_version_is_rewritten(self):
+        v = self.add_vacancy("test-resummarized", summarized_description=summary("v1"), content_hash="hash")
+        v.title = "Python engineer"
+        v.summarized_description = summary("v2")
+        db.update_vacancies(self.conn, [v])
+        self.assertEqual(self.stored(v), ("Python engineer", "v2"))
+
+    def test_summary_without_version_is_rewritten(self):
+        # resummarize.py saves title/description-only summaries without a version
+        v = self.add_vacancy("test-unversioned", summarized_description=summary(None), content_hash="hash")
+        v.summarized_description = summary("v2")
+        db.update_vacancies(self.conn, [v])
+        self.assertEqual(self.stored(v)[1], "v2")
+
+    def test_bulk_upsert_rewrites_other_keywords_version(self):
+        v = self.add_vacancy("test-bulk", summarized_description=summary("v1"), content_hash="hash")
+        v.summarized_description = summary("v2")
+        db.bulk_upsert_vacancies(self.conn, SOURCE, [v])
+        self.assertEqual(self.stored(v)[1], "v2")
+
+class SkillStatsTest(DatabaseTest):
+    DAY = dt.datetime(2001, 1, 1, 12, 0) # no real vacancies are published then
+
+    def test_zero_salary_isnt_salaried(self):
+        # cv.lv stores 0 as both bounds when a vacancy has no salary
+        self.add_vacancy("test-salary-1", published=self.DAY, salary_min=1000, salary_max=2000, summarized_description=summary("v1"))
+        self.add_vacancy("test-salary-2", published=self.DAY, salary_min=3000, salary_max=3000, summarized_description=summary("v1"))
+        self.add_vacancy("test-salary-3", published=self.DAY, salary_min=0, salary_max=0, summarized_description=summary("v1"))
+        self.add_vacancy("test-salary-4", published=self.DAY, salary_min=0, salary_max=2500, summarized_description=summary("v1"))
+        stats = self.fetch_one(
+            """SELECT vacancies, salaried_vacancies, salary_min, salary_median, salary_max
+            FROM work_scraper.skill_stats
+            WHERE web_source = work_scraper.get_website_id(%s) AND day = %s AND keyword = 'python'""",
+            (SOURCE, self.DAY.date())
+        )
+        self.assertEqual(stats, (4, 3, 1000, 2500, 3000))
+
+    def test_other_days_arent_serialized(self):
+        # a transaction refreshing one day doesn't block a refresh of another day
+        self.add_vacancy("test-lock-1", published=self.DAY, summarized_description=summary("v1"))
+        other = self.add_vacancy("test-lock-2", published=self.DAY + dt.timedelta(days=1), summarized_description=summary("v1"))
+        holder = db.pg.connect(**db.connection_params())
+        try:
+            cur = holder.cursor()
+            cur.execute(
+                "UPDATE work_scraper.vacancies SET salary_max = 1000 WHERE web_source = work_scraper.get_website_id(%s) AND vacancy_web_id = %s",
+                (SOURCE, "test-lock-1")
+            )
+            other.salary_max = 2000
+            cur = self.conn.cursor()
+            cur.execute("SET lock_timeout = '2s'")
+            db.update_vacancies(self.conn, [other]) # would time out if all refreshes shared a lock
+        finally:
+            holder.rollback()
+            holder.close()
+
+class SyncVacancyIdsTest(DatabaseTest):
+    def stored(self, v: Vacancy) -> tuple:
+        return self.fetch_one(
+            """SELECT expires IS NOT NULL, next_check_at <= now(), content_hash
+            FROM work_scraper.vacancies WHERE id = %s""",
+            (v.db_id,)
+        )
+
+    def test_missing_vacancy_is_expired(self):
+        listed = self.add_vacancy("test-listed", content_hash="hash")
+        missing = self.add_vacancy("test-missing", content_hash="hash")
+        db.sync_vacancy_ids(self.conn, ["test-listed"], SOURCE)
+        self.assertEqual(self.stored(listed), (False, False, "hash"))
+        self.assertEqual(self.stored(missing), (True, None, "hash")) # not checked anymore
+
+    def test_listed_again_is_rescheduled(self):
+        # a rescan can miss an id while the list shifts
+        v = self.add_vacancy("test-relisted", content_hash="hash")
+        db.sync_vacancy_ids(self.conn, ["test-other"], SOURCE)
+        self.web_ids.append("test-other")
+        db.sync_vacancy_ids(self.conn, ["test-relisted"], SOURCE)
+        # due now and fetched in full, the fetch sets the expiry date again
+        self.assertEqual(self.stored(v), (False, True, None))
+        self.assertIsNone(self.fetch_one(
+            "SELECT 1 FROM work_scraper.unscanned_vacancies WHERE vacancy_web_id = %s", ("test-relisted",)
+        ))
+
+class VacancyWriterTest(DatabaseTest):
+    def test_on_saved_is_called_after_saving(self):
+        saved: list[PendingWrite] = []
+        writer = db.VacancyWriter(on_saved=lambda writes: saved.extend(writes))
+        new = VacancyBatch()
+        new.append(Vacancy(web_id="test-writer", title="Python developer", summarized_description=summary("v1")))
+        self.web_ids.append("test-writer")
+        writer.add(PendingWrite(SOURCE, new=new))
+        writer.close()
+        self.assertEqual([w.new.web_id for w in saved], [["test-writer"]])
+        self.assertIsNotNone(self.fetch_one("SELECT id FROM work_scraper.vacancies WHERE vacancy_web_id = %s", ("test-writer",)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import datetime as dt
+import psycopg2.extensions as pgext
+import utils.db_connection as db
+from utils.util_classes import Vacancy
+
+RIGA = dt.timezone(dt.timedelta(hours=2))
+
+class TimestampTest(unittest.TestCase):
+    def test_aware_datetime_is_naive_utc(self):
+        self.assertEqual(db.db_timestamp(dt.datetime(2025, 3, 1, 10, 0, tzinfo=RIGA)), dt.datetime(2025, 3, 1, 8, 0))
+
+    def test_naive_datetime_is_unchanged(self):
+        self.assertEqual(db.db_timestamp(dt.datetime(2025, 3, 1, 10, 0)), dt.datetime(2025, 3, 1, 10, 0))
+        self.assertIsNone(db.db_timestamp(None))
+
+    def test_copy_matches_array_parameters(self):
+        # a vacancy saved with COPY (bulk_upsert_vacancies) and with array parameters
+        # (add_new_vacancies, update_vacancies) must get the same TIMESTAMP values
+        v = Vacancy(
+            db_id=1, web_id="1",
+            published=dt.datetime(2025, 3, 1, 10, 0, tzinfo=RIGA),
+            expires=dt.datetime(2025, 3, 31, 23, 59, 59, tzinfo=dt.timezone.utc)
+        )
+        add_params = db.add_vacancies_params("cv.lv", [v])
+        update_params = db.update_vacancies_params([v])
+        for i, value in enumerate((v.published, v.expires)):
+            copied = dt.datetime.fromisoformat(db.copy_format(value)) # how a TIMESTAMP column reads it
+            self.assertIsNone(copied.tzinfo)
+            self.assertEqual(copied, add_params[6+i][0])
+            self.assertEqual(copied, update_params[7+i][0])
+            self.assertEqual(pgext.adapt(add_params[6+i][0]).getquoted(), f"'{copied.isoformat()}'::timestamp".encode())
+            self.assertEqual(copied.replace(tzinfo=dt.timezone.utc), value)
+
+if __name__ == "__main__":
+    unittest.main()
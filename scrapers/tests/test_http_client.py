@@ -0,0 +1,68 @@
+import unittest
+import requests
+import utils.http_client as http
+
+URL: str = "https://cv.lv/vacancy/1"
+
+def response(status: int = 200, etag: str | None = "\"v1\"") -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    if etag:
+        resp.headers["ETag"] = etag
+    return resp
+
+class ResponseSession:
+    """
+    Session returning the given response to every request.
+    """
+    def __init__(self, resp: requests.Response):
+        self.resp = resp
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.resp
+
+class ValidatorStoreTest(unittest.TestCase):
+    def test_staged_validators_are_used_once_confirmed(self):
+        store = http.ValidatorStore()
+        store.stage("cv.lv", "1", URL, response())
+        self.assertEqual(store.headers_for(URL), {}) # not saved yet
+        store.confirm("cv.lv", ["1"])
+        self.assertEqual(store.headers_for(URL), {"If-None-Match": "\"v1\""})
+
+    def test_unconfirmed_validators_dont_replace_saved_ones(self):
+        # the vacancy failed to parse or save, it has to be fetched in full next time
+        store = http.ValidatorStore()
+        store.remember(URL, response(etag="\"v1\""))
+        store.stage("cv.lv", "1", URL, response(etag="\"v2\""))
+        store.confirm("cv.lv", ["2"])
+        self.assertEqual(store.headers_for(URL), {"If-None-Match": "\"v1\""})
+
+    def test_staged_entries_are_limited(self):
+        store = http.ValidatorStore(max_entries=2)
+        for web_id in ("1", "2", "3"):
+            store.stage("cv.lv", web_id, f"{URL}/{web_id}", response())
+        store.confirm("cv.lv", ["1", "2", "3"])
+        self.assertEqual(store.headers_for(f"{URL}/1"), {})
+        self.assertNotEqual(store.headers_for(f"{URL}/3"), {})
+
+class GetTest(unittest.TestCase):
+    def setUp(self):
+        self.session = http.get_session()
+        http.validators = http.ValidatorStore()
+
+    def tearDown(self):
+        http.set_session(self.session)
+        http.validators = http.ValidatorStore()
+
+    def test_response_validators_arent_remembered(self):
+        http.set_session(ResponseSession(response()))
+        http.get(URL)
+        self.assertEqual(http.validators.headers_for(URL), {})
+
+    def test_not_modified(self):
+        http.set_session(ResponseSession(response(304)))
+        with self.assertRaises(http.NotModifiedError):
+            http.get(URL, conditional=True)
+
+if __name__ == "__main__":
+    unittest.main()
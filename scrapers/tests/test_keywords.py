@@ -0,0 +1,48 @@
+import json, os, random, unittest
+from utils.keywords import KeywordMatcher
+
+KEYWORDS_PATH: str = os.path.join(os.path.dirname(__file__), "..", "..", "keywords.json")
+
+def reference_match(to_summarize: str, keywords: dict[str, list[str]]) -> list[str]:
+    """
+    Substring search the compiled matcher replaced, every alias is searched for as f" {alias}".
+    """
+    to_summarize = to_summarize.lower()
+    matched: list[str] = []
+    for k in keywords:
+        for srch in keywords[k]:
+            if to_summarize.find(f" {srch}") >= 0:
+                matched.append(k)
+                break
+    return matched
+
+class KeywordMatcherTest(unittest.TestCase):
+    def setUp(self):
+        with open(KEYWORDS_PATH, "r") as file:
+            self.keywords_json: dict[str, dict[str, list[str]]] = json.load(file)
+        self.matcher = KeywordMatcher(self.keywords_json)
+
+    def assert_same_as_reference(self, text: str):
+        matched = self.matcher.match(text)
+        for cat_name, category in self.keywords_json.items():
+            self.assertEqual(matched[cat_name], reference_match(text, category), f"{cat_name}: {text!r}")
+
+    def test_matches_reference_on_aliases(self):
+        aliases = [a for category in self.keywords_json.values() for k in category for a in category[k]]
+        filler = ["developer", "team", "Senior", "and", "with", "experience", "c", "go", "net", "-", "/"]
+        rng = random.Random(42)
+        for _ in range(500):
+            words = rng.choices(aliases + filler, k=rng.randint(0, 30))
+            self.assert_same_as_reference(" " + rng.choice([" ", "  ", ", "]).join(words) + " ")
+
+    def test_overlapping_aliases(self):
+        # shorter aliases that are prefixes of a longer found alias still count
+        self.assert_same_as_reference(" javascript java c++ c golang go  net ")
+        self.assert_same_as_reference(" JAVA, Python/SQL ")
+        self.assert_same_as_reference("")
+
+    def test_empty_dictionary(self):
+        self.assertEqual(KeywordMatcher({"general": {}}).match(" python "), {"general": []})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+from utils.parser import remove_html_tags
+
+class RemoveHtmlTagsTest(unittest.TestCase):
+    def test_removes_tags_and_skipped_elements(self):
+        self.assertEqual(remove_html_tags("<p>Python <b>developer</b></p><script>var x;</script>"), "Python developer")
+        self.assertEqual(remove_html_tags("AT&amp;T"), "AT&T")
+
+    def test_plain_text(self):
+        self.assertEqual(remove_html_tags("  \n Python developer"), "Python developer")
+
+    def test_nul_is_replaced(self):
+        # postgres TEXT/JSONB columns reject NUL, a single one would fail the whole write
+        for text in ("Python\x00developer", "<p>Python\x00developer</p>", "<p>Python&#0;developer</p>"):
+            result = remove_html_tags(text)
+            self.assertNotIn("\x00", result, repr(text))
+            # replaced, not just dropped, so the words aren't joined
+            self.assertNotIn("Pythondeveloper", result, repr(text))
+
+    def test_control_characters_are_replaced(self):
+        self.assertEqual(remove_html_tags("a\x01b\x1fc"), "a b c")
+        self.assertEqual(remove_html_tags("<p>a&#1;b\x0bc</p>"), "a b c")
+        self.assertEqual(remove_html_tags("a\tb\nc\rd"), "a\tb\nc\rd")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+# Append-only, zstd compressed archive of raw vacancy responses, so vacancies can be parsed and
+# summarized again (e.g. after a parsing fix) without fetching them from the websites.
+# Replay, from the scrapers directory: python -m utils.archive cv-lv [--since 2025-01-01] [--workers N]
+import argparse, json, os, threading, time
+import datetime as dt
+import multiprocessing as mp
+from typing import Iterator
+import zstandard as zstd
+import utils.db_connection as db
+import utils.metrics as metrics
+from utils.keywords import KeywordMatcher
+from utils.util_classes import Vacancy
+
+class RawArchive:
+    """
+    Raw responses keyed by (source, web id, fetch time). Every process writes its own segment files
+    (directory/source/YYYY-MM/<start time>-<pid>.jsonl.zst, one JSON record per line), a new segment
+    is started every max_segment_bytes of uncompressed records. Records are flushed as written,
+    so a crash only loses the record being written.
+    """
+    def __init__(self, directory: str, max_segment_bytes: int = 256*1024*1024, level: int = 9):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.level = level
+        # source: (file, zstd writer, uncompressed bytes written)
+        self.segments: dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def record(self, source: str, web_id: str, payload, **extra):
+        """
+        Appends a raw response (JSON serializable) of the vacancy, with extra data needed to
+        parse it again (e.g. OCR text of an image description).
+        """
+        line = json.dumps({
+            "web_id": web_id,
+            "fetched": dt.datetime.now().isoformat(),
+            "payload": payload,
+            "extra": extra
+        }, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self.lock:
+            file, writer, written = self.segments.get(source) or self.open_segment(source)
+            writer.write(line)
+            writer.flush(zstd.FLUSH_BLOCK) # decodable up to here, even if the process dies
+            written += len(line)
+            if written >= self.max_segment_bytes:
+                writer.close() # ends the frame and closes the file
+                self.segments.pop(source)
+            else:
+                self.segments[source] = (file, writer, written)
+
+    def open_segment(self, source: str) -> tuple:
+        now = dt.datetime.now()
+        directory = os.path.join(self.directory, source, now.strftime("%Y-%m"))
+        os.makedirs(directory, exist_ok=True)
+        file = open(os.path.join(directory, f"{now.strftime("%Y%m%dT%H%M%S%f")}-{os.getpid()}.jsonl.zst"), "xb")
+        # a compressor can't be shared by open writers
+        return (file, zstd.ZstdCompressor(level=self.level).stream_writer(file), 0)
+
+    def close(self):
+        """
+        Finishes all open segments.
+        """
+        with self.lock:
+            for _, writer, _ in self.segments.values():
+                writer.close()
+            self.segments = {}
+
+def segment_paths(directory: str, source: str) -> list[str]:
+    """
+    Returns: archive segments of the source, oldest first
+    """
+    source_dir = os.path.join(directory, source)
+    if not os.path.isdir(source_dir):
+        return []
+    paths: list[str] = []
+    for month in sorted(os.listdir(source_dir)):
+        month_dir = os.path.join(source_dir, month)
+        paths += [os.path.join(month_dir, f) for f in sorted(os.listdir(month_dir)) if f.endswith(".jsonl.zst")]
+    return paths
+
+def read_segment(path: str) -> Iterator[dict]:
+    """
+    Yields the records of a segment. A segment cut short by a crash is read up to its last full record.
+    """
+    with open(path, "rb") as file:
+        reader = zstd.ZstdDecompressor().stream_reader(file, read_across_frames=True)
+        buffer = b""
+        try:
+            while chunk := reader.read(1024*1024):
+                buffer += chunk
+                lines = buffer.split(b"\n")
+                buffer = lines.pop()
+                for line in lines:
+                    yield json.loads(line)
+        except zstd.ZstdError:
+            metrics.log("Archive segment is cut short", path=path)
+
+def read_records(directory: str, source: str, since: dt.datetime | None = None,
+                 latest_only: bool = True) -> Iterator[dict]:
+    """
+    Yields archived records of the source fetched since the given time, oldest first.
+    If latest_only, only the last fetch of every vacancy is yielded (the archive is read twice).
+    """
+    paths = segment_paths(directory, source)
+    latest: dict[str, str] = {}
+    if latest_only:
+        for path in paths:
+            for r in read_segment(path):
+                latest[r["web_id"]] = max(latest.get(r["web_id"], ""), r["fetched"])
+
+    after = since.isoformat() if since else ""
+    for path in paths:
+        for r in read_segment(path):
+            if r["fetched"] < after:
+                continue
+            if latest_only and latest[r["web_id"]] != r["fetched"]:
+                continue
+            yield r
+
+_archive: RawArchive | None = None
+_archive_lock = threading.Lock()
+_archive_configured: bool = False
+
+def get_archive() -> RawArchive | None:
+    """
+    Returns the process wide archive, created on first use in RAW_ARCHIVE_DIR.
+    None if RAW_ARCHIVE_DIR isn't set (archiving is disabled).
+    """
+    global _archive, _archive_configured
+    with _archive_lock:
+        if not _archive_configured:
+            directory = os.getenv("RAW_ARCHIVE_DIR", "")
+            if directory:
+                _archive = RawArchive(directory, int(os.getenv("RAW_ARCHIVE_SEGMENT_MB", "256"))*1024*1024)
+            _archive_configured = True
+        return _archive
+
+def record(source: str, web_id: str, payload, **extra):
+    """
+    Archives a raw response if archiving is enabled, see RawArchive.record().
+    Never throws, a failing archive shouldn't stop scraping.
+    """
+    try:
+        archive = get_archive()
+        if archive:
+            archive.record(source, web_id, payload, **extra)
+    except Exception as e:
+        metrics.log("Couldn't archive raw response!", source=source, web_id=web_id, error=repr(e))
+
+def close_archive():
+    """
+    Finishes the process wide archive's open segments.
+    """
+    with _archive_lock:
+        if _archive:
+            _archive.close()
+
+_scraper = None
+_keywords: KeywordMatcher | None = None
+
+def init_worker(scraper_dir: str, keywords_json: dict[str, dict[str, list[str]]]):
+    """
+    Loads the scraper and compiles the keyword matcher once per worker process.
+    """
+    global _scraper, _keywords
+    from utils.runtime import load_scraper
+    _scraper = load_scraper(scraper_dir)
+    _keywords = KeywordMatcher(keywords_json)
+
+def parse_record(r: dict) -> Vacancy | None:
+    """
+    Returns: vacancy parsed by the scraper's parse_archived(), None if parsing failed
+    """
+    try:
+        return _scraper.parse_archived(r["web_id"], r["payload"], r["extra"], _keywords)
+    except Exception as e:
+        metrics.log("Failed to parse archived vacancy", web_id=r["web_id"], fetched=r["fetched"], error=repr(e))
+        return None
+
+def replay(scraper_dir: str, directory: str, keywords_json: dict[str, dict[str, list[str]]],
+           workers: int, since: dt.datetime | None = None) -> int:
+    """
+    Parses and summarizes the last archived fetch of every vacancy of the scraper's source again
+    using a pool of worker processes, then updates the saved vacancies in bulk.\n
+    Returns: amount of replayed vacancies
+    """
+    from utils.runtime import load_scraper
+    source: str = load_scraper(scraper_dir).DOMAIN
+    conn = db.get_connection()
+    try:
+        with mp.get_context("forkserver").Pool(max(1, workers), init_worker, (scraper_dir, keywords_json)) as pool:
+            vacancies = pool.imap(parse_record, read_records(directory, source, since), chunksize=16)
+            return db.reparse_vacancies(conn, source, (v for v in vacancies if v is not None))
+    finally:
+        db.close_connection(conn)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse archived raw vacancy responses again and update the saved vacancies")
+    parser.add_argument("scraper", help="scraper directory, e.g. cv-lv")
+    parser.add_argument("--dir", default=os.getenv("RAW_ARCHIVE_DIR", "/app/raw_archive"), help="archive directory")
+    parser.add_argument("--since", type=dt.datetime.fromisoformat, default=None, help="only replay vacancies fetched since, e.g. 2025-01-01")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parser processes")
+    parser.add_argument("--keywords", default="/keywords.json", help="keywords.json path")
+    args = parser.parse_args()
+
+    with open(args.keywords, "r") as file:
+        keywords_json: dict[str, dict[str, list[str]]] = json.load(file)
+
+    started = time.monotonic()
+    total = replay(args.scraper, args.dir, keywords_json, args.workers, args.since)
+    elapsed = time.monotonic() - started
+    metrics.log(f"Replayed {total} vacancies in {elapsed:.1f}s ({total/max(elapsed, 1e-9):.0f} vacancies/s)")
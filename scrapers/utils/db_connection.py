@@ -1,22 +1,49 @@
 import psycopg2 as pg
+import psycopg2.errors
 import psycopg2.extensions as pgext
-from psycopg2.extras import Json
-from dataclasses import asdict
-import os, ast
-from utils.util_classes import Vacancy, VacanciesList
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from contextlib import contextmanager
+import os, ast, io, json, queue, re, threading, time
+import datetime as dt
+from typing import Callable, Iterable, Iterator
+from utils.util_classes import Vacancy, VacancyBatch, SummarizedDescription, PendingWrite
+from utils.util_funcs import chunked
+import utils.metrics as metrics
+
+# pooled connections unused for longer than this are checked before being handed out
+HEALTH_CHECK_AFTER: float = 30 # seconds
+
+class PreparedConnection(pgext.connection):
+    """
+    Database connection that keeps track of statements prepared on it
+    and when it was last used.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+        self.last_used: float = time.monotonic()
+
+_pool: ThreadedConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+def connection_params() -> dict:
+    """
+    Returns: database connection parameters from environment variables
+    """
+    return {
+        "host": os.getenv("DB_HOST", "localhost"),
+        "database": os.getenv("DB_NAME", "work_scraper"),
+        "user": os.getenv("DB_SCRAPER_USER", "postgres"),
+        "password": os.getenv("DB_SCRAPER_PASSWORD", "postgres"),
+        "port": os.getenv("DB_PORT", 5432)
+    }
 
 def get_connection() -> pgext.connection:
     """
     Create a connection to the database. Throws an exception if fails.
     """
     # Connect to the database
-    c = pg.connect(
-        host=os.getenv("DB_HOST", "localhost"),
-        database=os.getenv("DB_NAME", "work_scraper"),
-        user=os.getenv("DB_SCRAPER_USER", "postgres"),
-        password=os.getenv("DB_SCRAPER_PASSWORD", "postgres"),
-        port=os.getenv("DB_PORT", 5432)
-    )
+    c = pg.connect(connection_factory=PreparedConnection, **connection_params())
     return c
 
 def close_connection(conn: pgext.connection):
@@ -25,12 +52,111 @@ def close_connection(conn: pgext.connection):
     """
     conn.close()
 
+def get_pool() -> ThreadedConnectionPool:
+    """
+    Returns the process wide connection pool, creating it on first use.
+    The pool keeps up to DB_POOL_MAX_CONNECTIONS (default 5) connections open.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadedConnectionPool(
+                1, int(os.getenv("DB_POOL_MAX_CONNECTIONS", "5")),
+                connection_factory=PreparedConnection, **connection_params()
+            )
+        return _pool
+
+def connection_alive(conn: pgext.connection) -> bool:
+    """
+    Checks whether the connection can still be used, pinging the server
+    if the connection hasn't been used for a while.
+    """
+    if conn.closed:
+        return False
+    if time.monotonic() - getattr(conn, "last_used", 0) < HEALTH_CHECK_AFTER:
+        return True
+
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1;")
+        cur.close()
+        conn.rollback()
+        return True
+    except (pg.OperationalError, pg.InterfaceError):
+        return False
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def acquire_connection() -> pgext.connection:
+    """
+    Takes a healthy connection from the pool, broken connections (e.g. after a
+    database restart) are replaced by new ones. Throws an exception if fails.
+    Give the connection back using release_connection().
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    while not connection_alive(conn):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    return conn
+
+def release_connection(conn: pgext.connection):
+    """
+    Returns the connection to the pool, rolling back an unfinished transaction.
+    Broken connections are closed.
+    """
+    broken: bool = bool(conn.closed)
+    if not broken:
+        try:
+            conn.rollback()
+            if isinstance(conn, PreparedConnection):
+                conn.last_used = time.monotonic()
+        except (pg.OperationalError, pg.InterfaceError):
+            broken = True
+    get_pool().putconn(conn, close=broken)
+
+@contextmanager
+def pooled_connection() -> Iterator[pgext.connection]:
+    """
+    Context manager version of acquire_connection() and release_connection().
+    """
+    conn = acquire_connection()
+    try:
+        yield conn
+    finally:
+        release_connection(conn)
+
+def execute_prepared(conn: pgext.connection, cur: pgext.cursor, name: str,
+                     statement: str, params: tuple):
+    """
+    Executes a statement (with %s placeholders) as a prepared statement, preparing it
+    on the connection on first use. Connections not created by this module
+    execute the statement directly.
+    """
+    if not isinstance(conn, PreparedConnection):
+        cur.execute(statement, params)
+        return
+
+    if name not in conn.prepared:
+        placeholders = iter(range(1, len(params)+1))
+        server_statement = re.sub(r"%s", lambda _: f"${next(placeholders)}", statement)
+        cur.execute(f"PREPARE {name} AS {server_statement};")
+        conn.prepared.add(name)
+    try:
+        cur.execute(f"EXECUTE {name} ({", ".join(["%s"]*len(params))});", params)
+    except pg.errors.FeatureNotSupported:
+        # "cached plan must not change result type", function was replaced by a migration
+        conn.rollback()
+        cur.execute(f"DEALLOCATE {name};")
+        conn.prepared.discard(name)
+        execute_prepared(conn, cur, name, statement, params)
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
 def check_if_website_stale(conn: pgext.connection, website: str) -> bool:
     """
     Checks whether the website vacancy list is stale and should be refetched.
     """
     cur: pgext.cursor = conn.cursor()
-    cur.execute("SELECT work_scraper.website_is_stale(%s::TEXT);", (website,))
+    execute_prepared(conn, cur, "website_is_stale", "SELECT work_scraper.website_is_stale(%s::TEXT)", (website,))
     results = cur.fetchall()
     stale: bool = False
     for r in results:
@@ -39,6 +165,7 @@ def check_if_website_stale(conn: pgext.connection, website: str) -> bool:
 
     return stale
 
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
 def set_website_scan_status(conn: pgext.connection, website: str,
                             scanning: bool):
     """
@@ -49,129 +176,295 @@ def set_website_scan_status(conn: pgext.connection, website: str,
     conn.commit()
     cur.close()
 
-def convert_vacancies_to_columns(vacancies: list[Vacancy]) -> VacanciesList:
+def convert_vacancies_to_columns(vacancies: Iterable[Vacancy] | VacancyBatch) -> VacancyBatch:
     """
-    Converts Vacancies list to a columns in following format:\n
+    Converts Vacancies to columns (a batch is returned as it is) in following format:\n
     db_id, title, employer, salary_min, salary_max, hourly_rate, remote,
-    published, expires, country_code, city_name, fully_fetched, web_id,
-    description, summarized_description
-    """
-    vl: VacanciesList = VacanciesList()
-
-    for v in vacancies:
-        vl.db_id.append(v.db_id)
-        vl.title.append(v.title)
-        vl.employer.append(v.employer)
-        vl.salary_min.append(v.salary_min)
-        vl.salary_max.append(v.salary_max)
-        vl.hourly_rate.append(v.hourly_rate)
-        vl.remote.append(v.remote)
-        vl.published.append(v.published)
-        vl.expires.append(v.expires)
-        vl.country_code.append(v.country_code)
-        vl.city_name.append(v.city_name)
-        vl.web_id.append(v.web_id)
-        vl.description.append(v.description)
-        vl.summarized_description.append(Json(asdict(v.summarized_description)) if v.summarized_description else None)
-
-    return vl
+    published, expires, country_code, city_name, web_id,
+    description, summarized_description (JSON), content_hash
+    """
+    if isinstance(vacancies, VacancyBatch):
+        return vacancies
+    vb = VacancyBatch()
+    vb.extend(vacancies)
+    return vb
 
+ADD_VACANCIES_SQL: str = """CALL work_scraper.add_vacancies(
+        %s::TEXT[], %s::TEXT[],
+        %s::DOUBLE PRECISION[], %s::DOUBLE PRECISION[],
+        %s::BOOLEAN[], %s::BOOLEAN[],
+        %s::TIMESTAMP[], %s::TIMESTAMP[],
+        %s::TEXT[], %s::TEXT[],
+        %s::TEXT[], %s::TEXT,
+        %s::TEXT[], %s::JSONB[],
+        %s::TEXT[]);"""
+
+UPDATE_VACANCIES_SQL: str = """CALL work_scraper.update_vacancies(
+        %s::INTEGER[], %s::TEXT[],
+        %s::TEXT[], %s::DOUBLE PRECISION[],
+        %s::DOUBLE PRECISION[], %s::BOOLEAN[],
+        %s::BOOLEAN[], %s::TIMESTAMP[],
+        %s::TIMESTAMP[], %s::VARCHAR[],
+        %s::TEXT[], %s::TEXT[], %s::JSONB[],
+        %s::TEXT[]);"""
+
+def db_timestamp(value: dt.datetime | None) -> dt.datetime | None:
+    """
+    Returns: the datetime as it's stored in TIMESTAMP columns, time zone aware datetimes are converted
+    to naive UTC (a TIMESTAMP column would silently drop the offset)
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(dt.timezone.utc).replace(tzinfo=None)
+
+def add_vacancies_params(website: str, vacancies: list[Vacancy] | VacancyBatch) -> tuple:
+    """
+    Returns: ADD_VACANCIES_SQL parameters for the vacancies
+    """
+    vac_list = convert_vacancies_to_columns(vacancies)
+    return (
+        vac_list.title, # title
+        vac_list.employer, # employer
+        vac_list.salary_min, # salary_min
+        vac_list.salary_max, # salary_max
+        vac_list.hourly_rate, # hourly_rate
+        vac_list.remote, # remote
+        [db_timestamp(d) for d in vac_list.published], # published
+        [db_timestamp(d) for d in vac_list.expires], # expires
+        vac_list.country_code, # country_code
+        vac_list.city_name, # city_name
+        vac_list.web_id, # web_id
+        website,
+        vac_list.description, # description
+        vac_list.summarized_description, # summarized_description
+        vac_list.content_hash, # content_hash
+    )
+
+def update_vacancies_params(vacancies: list[Vacancy] | VacancyBatch) -> tuple:
+    """
+    Returns: UPDATE_VACANCIES_SQL parameters for the vacancies
+    """
+    vac_list = convert_vacancies_to_columns(vacancies)
+    return (
+        vac_list.db_id, # db_id
+        vac_list.title, # title
+        vac_list.employer, # employer
+        vac_list.salary_min, # salary_min
+        vac_list.salary_max, # salary_max
+        vac_list.hourly_rate, # hourly_rate
+        vac_list.remote, # remote
+        [db_timestamp(d) for d in vac_list.published], # published
+        [db_timestamp(d) for d in vac_list.expires], # expires
+        vac_list.country_code, # country_code
+        vac_list.city_name, # city_name
+        vac_list.description, # description
+        vac_list.summarized_description, # summarized_description
+        vac_list.content_hash, # content_hash
+    )
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
 def add_new_vacancies(conn: pgext.connection, website: str,
-                      vacancies: list[Vacancy]):
+                      vacancies: list[Vacancy] | VacancyBatch):
     """
     Adds up to 1000 new vacancies to the saved vacancy list.
-    Optionally, autocloses the database connection.
     """
     if len(vacancies) == 0:
         return
 
-    vac_list = convert_vacancies_to_columns(vacancies)
     cur: pgext.cursor = conn.cursor()
-    cur.execute(
-        """CALL work_scraper.add_vacancies(
-        %s::TEXT[], %s::TEXT[],
-        %s::DOUBLE PRECISION[], %s::DOUBLE PRECISION[],
-        %s::BOOLEAN[], %s::BOOLEAN[],
-        %s::TIMESTAMP[], %s::TIMESTAMP[],
-        %s::TEXT[], %s::TEXT[],
-        %s::TEXT[], %s::TEXT,
-        %s::TEXT[], %s::JSONB[]);""",
-        (
-            vac_list.title, # title
-            vac_list.employer, # employer
-            vac_list.salary_min, # salary_min
-            vac_list.salary_max, # salary_max
-            vac_list.hourly_rate, # hourly_rate
-            vac_list.remote, # remote
-            vac_list.published, # published
-            vac_list.expires, # expires
-            vac_list.country_code, # country_code
-            vac_list.city_name, # city_name
-            vac_list.web_id, # web_id
-            website,
-            vac_list.description, # description
-            vac_list.summarized_description, # summarized_description
-        ))
+    cur.execute(ADD_VACANCIES_SQL, add_vacancies_params(website, vacancies))
     conn.commit()
     cur.close()
 
-def update_vacancies(conn: pgext.connection, vacancies: list[Vacancy]):
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def update_vacancies(conn: pgext.connection, vacancies: list[Vacancy] | VacancyBatch):
     """
     Updates already existing vacancies in the database.
     """
     if len(vacancies) == 0:
         return
-    
-    vac_list = convert_vacancies_to_columns(vacancies)
+
     cur: pgext.cursor = conn.cursor()
+    cur.execute(UPDATE_VACANCIES_SQL, update_vacancies_params(vacancies))
+    conn.commit()
+    cur.close()
+
+def copy_vacancy_staging(cur: pgext.cursor, vacancies: Iterable[Vacancy]) -> int:
+    """
+    Creates the vacancy_staging temporary table (dropped on commit) and streams
+    the vacancies (can be a generator) into it using COPY.\n
+    Returns: amount of copied vacancies
+    """
     cur.execute(
-        """CALL work_scraper.update_vacancies(
-        %s::INTEGER[], %s::TEXT[],
-        %s::TEXT[], %s::DOUBLE PRECISION[],
-        %s::DOUBLE PRECISION[], %s::BOOLEAN[],
-        %s::BOOLEAN[], %s::TIMESTAMP[],
-        %s::TIMESTAMP[], %s::VARCHAR[],
-        %s::TEXT[], %s::TEXT[], %s::JSONB[]);""",
-        (
-            vac_list.db_id, # db_id
-            vac_list.title, # title
-            vac_list.employer, # employer
-            vac_list.salary_min, # salary_min
-            vac_list.salary_max, # salary_max
-            vac_list.hourly_rate, # hourly_rate
-            vac_list.remote, # remote
-            vac_list.published, # published
-            vac_list.expires, # expires
-            vac_list.country_code, # country_code
-            vac_list.city_name, # city_name
-            vac_list.description, # description
-            vac_list.summarized_description, # summarized_description
-        ))
+        """CREATE TEMPORARY TABLE vacancy_staging (
+        title TEXT, employer TEXT,
+        salary_min DOUBLE PRECISION, salary_max DOUBLE PRECISION,
+        is_hourly BOOLEAN, remote BOOLEAN,
+        published TIMESTAMP, expires TIMESTAMP,
+        country_code TEXT, city_name TEXT,
+        vacancy_web_id TEXT NOT NULL, description TEXT,
+        summarized JSONB, content_hash TEXT
+        ) ON COMMIT DROP;""")
+    copied: int = 0
+    for c in chunked(vacancies, 1000):
+        rows = io.StringIO()
+        for v in c:
+            rows.write("\t".join(copy_escape(copy_format(f)) for f in (
+                v.title, v.employer, v.salary_min, v.salary_max,
+                v.hourly_rate, v.remote, v.published, v.expires,
+                v.country_code, v.city_name, v.web_id, v.description,
+                v.summarized_description.to_json() if v.summarized_description else None,
+                v.content_hash
+            )))
+            rows.write("\n")
+        rows.seek(0)
+        cur.copy_expert("COPY vacancy_staging FROM STDIN;", rows)
+        copied += len(c)
+    return copied
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def bulk_upsert_vacancies(conn: pgext.connection, website: str, vacancies: Iterable[Vacancy],
+                          only_changed: bool = True) -> int:
+    """
+    Inserts new and updates existing vacancies (matched by web id) in bulk, meant for
+    backfills and re-imports of thousands of vacancies. Vacancies (can be a generator)
+    are streamed using COPY into a temporary staging table and merged with a single statement.
+    If only_changed, existing vacancies with the same content hash and summary keywords version aren't rewritten.\n
+    Returns: amount of uploaded vacancies
+    """
+    cur: pgext.cursor = conn.cursor()
+    try:
+        uploaded = copy_vacancy_staging(cur, vacancies)
+        cur.execute("CALL work_scraper.merge_vacancy_staging(%s::TEXT, %s::BOOLEAN);", (website, only_changed))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return uploaded
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def reparse_vacancies(conn: pgext.connection, website: str, vacancies: Iterable[Vacancy]) -> int:
+    """
+    Replaces the parsed data of existing vacancies (matched by web id) with vacancies parsed
+    again from archived responses (see utils/archive.py). Only vacancies whose saved content hash
+    matches the archived one are updated, so newer data and check schedules are left as they are.
+    Vacancies (can be a generator) are streamed using COPY, like in bulk_upsert_vacancies.\n
+    Returns: amount of uploaded vacancies
+    """
+    cur: pgext.cursor = conn.cursor()
+    try:
+        uploaded = copy_vacancy_staging(cur, vacancies)
+        cur.execute("CALL work_scraper.reparse_vacancy_staging(%s::TEXT);", (website,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return uploaded
+
+def iter_vacancy_descriptions(conn: pgext.connection, website: str | None, keywords_version: str | None = None,
+                              batch_size: int = 1000) -> Iterator[tuple[int, str | None, str, list[str]]]:
+    """
+    Yields stored descriptions of all vacancies of the website (all websites if None),
+    skipping vacancies summarized with keywords_version (if given). The vacancies are read
+    in pages of batch_size (ordered by id), so only a page is held in memory at a time.\n
+    Yields: (db_row_id, title, description, summarized description languages)
+    """
+    after_id: int = 0
+    while True:
+        cur: pgext.cursor = conn.cursor()
+        try:
+            execute_prepared(
+                conn, cur, "get_vacancy_descriptions",
+                "SELECT * FROM work_scraper.get_vacancy_descriptions(%s::TEXT, %s::TEXT, %s::INTEGER, %s::INTEGER)",
+                (website, keywords_version, after_id, batch_size)
+            )
+            rows = cur.fetchall()
+        finally:
+            cur.close()
+            conn.commit()
+
+        for r in rows:
+            yield (int(r[0]), r[1], str(r[2]), list(r[3] or []))
+        if len(rows) < batch_size:
+            return
+        after_id = int(rows[-1][0])
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def update_summaries(conn: pgext.connection, summaries: Iterable[tuple[int, SummarizedDescription | str]]) -> int:
+    """
+    Replaces summarized descriptions of existing vacancies in bulk. Summaries (can be a generator,
+    already serialized by SummarizedDescription.to_json() or not) are streamed using COPY into
+    a temporary staging table and applied with a single statement.\n
+    Returns: amount of uploaded summaries
+    """
+    cur: pgext.cursor = conn.cursor()
+    uploaded: int = 0
+    try:
+        cur.execute("CREATE TEMPORARY TABLE summary_staging (vacancy_id INTEGER NOT NULL, summarized JSONB) ON COMMIT DROP;")
+        for c in chunked(summaries, 5000):
+            rows = io.StringIO("".join(
+                f"{db_id}\t{copy_escape(summarized if isinstance(summarized, str) else summarized.to_json())}\n"
+                for db_id, summarized in c
+            ))
+            cur.copy_expert("COPY summary_staging (vacancy_id, summarized) FROM STDIN;", rows)
+            uploaded += len(c)
+        cur.execute("CALL work_scraper.merge_summary_staging();")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return uploaded
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def touch_vacancies(conn: pgext.connection, db_ids: list[int]):
+    """
+    Marks specified vacancies as checked without changing their data,
+    used when the vacancy hasn't changed on the website since the last check.
+    """
+    if len(db_ids) == 0:
+        return
+
+    cur = conn.cursor()
+    cur.execute("CALL work_scraper.touch_vacancies(%s::INTEGER[]);", (db_ids,))
     conn.commit()
     cur.close()
 
-def get_stale_vacancies(conn: pgext.connection, website: str) -> list[tuple[str, int]]:
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def get_stale_vacancies(conn: pgext.connection, website: str, batch_size: int = 20,
+                        lease: dt.timedelta = dt.timedelta(hours=2)) -> list[tuple[str, int, str | None, str | None]]:
     """
-    Returns up to 20 vacancy web ids and vacancy database ids that are stale for the given source.
-    The vacancies are reserved for fetching for 2 hours.\n
-    Returns: [(vacancy_web_id, db_row_id)]
+    Returns up to batch_size vacancy web ids, vacancy database ids, content hashes and keyword versions
+    of the summarized descriptions that are stale for the given source.
+    The vacancies are reserved for fetching for the lease duration, use release_stale_vacancies()
+    for vacancies that won't be processed.\n
+    Returns: [(vacancy_web_id, db_row_id, content_hash, keywords_version)]
     """
     cur: pgext.cursor = conn.cursor()
-    cur.execute(
-        "SELECT work_scraper.get_stale_vacancies(%s::TEXT);",
-        (website,)
+    execute_prepared(
+        conn, cur, "get_stale_vacancies",
+        "SELECT * FROM work_scraper.get_stale_vacancies(%s::TEXT, %s::INTEGER, %s::INTERVAL)",
+        (website, batch_size, lease)
     )
     conn.commit()
     results = cur.fetchall()
     
-    final: list[tuple[str, int]] = []
+    final: list[tuple[str, int, str | None, str | None]] = []
     for r in results:
-        t = ast.literal_eval(str(r[0]))
-        final.append((str(t[0]), int(t[1])))
+        final.append((str(r[0]), int(r[1]), r[2], r[3]))
     cur.close()
 
     return final
 
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
 def delete_vacancies(conn: pgext.connection, db_ids: list[int]):
     """
     Deletes specified vacancies from the database.
@@ -184,6 +477,7 @@ def delete_vacancies(conn: pgext.connection, db_ids: list[int]):
     conn.commit()
     cur.close()
 
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
 def delete_unscanned_vacancies(conn: pgext.connection, db_ids: list[int]):
     """
     Deletes specified unscanned vacancies from the unscanned vacancy table in database.
@@ -196,6 +490,35 @@ def delete_unscanned_vacancies(conn: pgext.connection, db_ids: list[int]):
     conn.commit()
     cur.close()
 
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def release_unscanned_vacancies(conn: pgext.connection, db_ids: list[int]):
+    """
+    Ends the reservation of unscanned vacancies that won't be processed,
+    so they can be reserved again right away.
+    """
+    if len(db_ids) == 0:
+        return
+
+    cur = conn.cursor()
+    cur.execute("CALL work_scraper.release_unscanned_vacancies(%s::INTEGER[]);", (db_ids,))
+    conn.commit()
+    cur.close()
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def release_stale_vacancies(conn: pgext.connection, db_ids: list[int]):
+    """
+    Ends the reservation of stale vacancies that won't be processed,
+    so they can be reserved again right away.
+    """
+    if len(db_ids) == 0:
+        return
+
+    cur = conn.cursor()
+    cur.execute("CALL work_scraper.release_stale_vacancies(%s::INTEGER[]);", (db_ids,))
+    conn.commit()
+    cur.close()
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
 def add_unscanned_vacancies(conn: pgext.connection, web_ids: list[str], source: str):
     """
     Adds vacancy ids to a list in the database to later fully index them
@@ -208,17 +531,70 @@ def add_unscanned_vacancies(conn: pgext.connection, web_ids: list[str], source:
     conn.commit()
     cur.close()
 
-def get_unscanned_vacancies(conn: pgext.connection, website: str) -> list[tuple[str, int]]:
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def sync_vacancy_ids(conn: pgext.connection, web_ids: Iterable[str], source: str) -> int:
+    """
+    Uploads all currently listed vacancy ids of the source (can be a generator) using COPY,
+    then the database adds the new ones to unscanned vacancies, marks vacancies that are
+    no longer listed as expired and reschedules expired vacancies that are listed again.
+    Nothing is changed if an exception occurs while iterating web_ids or if there are no ids.\n
+    Returns: amount of uploaded ids
+    """
+    cur: pgext.cursor = conn.cursor()
+    uploaded: int = 0
+    try:
+        cur.execute("CREATE TEMPORARY TABLE scanned_vacancy_ids (vacancy_web_id TEXT NOT NULL) ON COMMIT DROP;")
+        for c in chunked(web_ids, 5000):
+            rows = io.StringIO("".join(f"{copy_escape(wid)}\n" for wid in c))
+            cur.copy_expert("COPY scanned_vacancy_ids (vacancy_web_id) FROM STDIN;", rows)
+            uploaded += len(c)
+        cur.execute("ANALYZE scanned_vacancy_ids;")
+        cur.execute("CALL work_scraper.sync_vacancy_ids(%s::TEXT);", (source,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    return uploaded
+
+def copy_format(value) -> str | None:
     """
-    Returns up to 20 vacancy web ids and vacancy database ids that haven't been scanned for the given source.
-    The vacancies are reserved for fetching for 2 hours. After fetching their info, add them to database by
-    using add_new_vacancies() function.\n
+    Converts a python value to its postgres text representation (None stays None).
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, dt.datetime):
+        return db_timestamp(value).isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def copy_escape(value: str | None) -> str:
+    """
+    Escapes a value for COPY text format.
+    """
+    if value is None:
+        return "\\N"
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def get_unscanned_vacancies(conn: pgext.connection, website: str, batch_size: int = 20,
+                            lease: dt.timedelta = dt.timedelta(hours=2)) -> list[tuple[str, int]]:
+    """
+    Returns up to batch_size vacancy web ids and vacancy database ids that haven't been scanned for the given source.
+    The vacancies are reserved for fetching for the lease duration. After fetching their info, add them to database by
+    using add_new_vacancies() or write_pending(), use release_unscanned_vacancies() for vacancies that won't be processed.\n
     Returns: [(vacancy_web_id, db_row_id)]
     """
     cur: pgext.cursor = conn.cursor()
-    cur.execute(
-        "SELECT work_scraper.get_unscanned_vacancies(%s::TEXT);",
-        (website,)
+    execute_prepared(
+        conn, cur, "get_unscanned_vacancies",
+        "SELECT work_scraper.get_unscanned_vacancies(%s::TEXT, %s::INTEGER, %s::INTERVAL)",
+        (website, batch_size, lease)
     )
     conn.commit()
     results = cur.fetchall()
@@ -229,4 +605,193 @@ def get_unscanned_vacancies(conn: pgext.connection, website: str) -> list[tuple[
         final.append((str(t[0]), int(t[1])))
     cur.close()
 
-    return final
\ No newline at end of file
+    return final
+@metrics.timed_function(metrics.DB_CALL_SECONDS)
+def write_pending(conn: pgext.connection, writes: list[PendingWrite]):
+    """
+    Saves the writes in a single transaction and round trip: new vacancies are added together
+    with the deletion of their unscanned rows, stale vacancies are updated or marked as checked.
+    """
+    statements: list[str] = []
+    params: list = []
+    new_by_website: dict[str, VacancyBatch] = {}
+    for w in writes:
+        if len(w.new) > 0:
+            new_by_website.setdefault(w.website, VacancyBatch()).merge(w.new)
+    for website, vacancies in new_by_website.items():
+        statements.append(ADD_VACANCIES_SQL)
+        params.extend(add_vacancies_params(website, vacancies))
+
+    unscanned_ids = [i for w in writes for i in w.unscanned_ids]
+    if len(unscanned_ids) > 0:
+        statements.append("CALL work_scraper.delete_unscanned_vacancies(%s::INTEGER[]);")
+        params.append(unscanned_ids)
+
+    updated = VacancyBatch()
+    for w in writes:
+        updated.merge(w.updated)
+    if len(updated) > 0:
+        statements.append(UPDATE_VACANCIES_SQL)
+        params.extend(update_vacancies_params(updated))
+
+    unchanged_ids = [i for w in writes for i in w.unchanged_ids]
+    if len(unchanged_ids) > 0:
+        statements.append("CALL work_scraper.touch_vacancies(%s::INTEGER[]);")
+        params.append(unchanged_ids)
+
+    if len(statements) == 0:
+        return
+
+    cur: pgext.cursor = conn.cursor()
+    try:
+        cur.execute("\n".join(statements), params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+class VacancyWriter:
+    """
+    Write-behind stage between fetching and the database. Fetched batches are queued (add() blocks
+    once max_queued batches are waiting) and saved by a background thread with write_pending(),
+    coalesced until flush_size vacancies are waiting or the oldest has waited flush_interval seconds.
+    Writes failing because of the connection are retried, writes the database rejects are split
+    until the rejected vacancy is found, close() saves everything still queued.
+    on_saved is called with the writes once they're saved.
+    """
+    def __init__(self, flush_size: int = 200, flush_interval: float = 5.0, max_queued: int = 16,
+                 retry_interval: float = 10.0, max_retry_interval: float = 300.0, max_attempts: int = 8,
+                 on_saved: Callable[[list[PendingWrite]], None] | None = None):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_attempts = max_attempts
+        self.on_saved = on_saved
+        # PendingWrite, threading.Event (flush marker) or None (close marker)
+        self.queue: queue.Queue[PendingWrite | threading.Event | None] = queue.Queue(max(1, max_queued))
+        self.closed: bool = False
+        self.thread = threading.Thread(target=self.run, name="vacancy-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, write: PendingWrite):
+        """
+        Queues the write, blocking while the queue is full. Throws an exception if the writer is closed.
+        """
+        if self.closed:
+            raise Exception("Vacancy writer is closed!")
+        self.queue.put(write)
+
+    def flush(self):
+        """
+        Blocks until everything queued so far is saved.
+        """
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """
+        Saves everything still queued and stops the background thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self):
+        pending: list[PendingWrite] = []
+        pending_rows: int = 0
+        oldest: float = 0
+        while True:
+            timeout = max(0, oldest + self.flush_interval - time.monotonic()) if len(pending) > 0 else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                # the oldest pending write has waited for flush_interval
+                self.save(pending)
+                pending = []
+                pending_rows = 0
+                continue
+
+            if isinstance(item, PendingWrite):
+                if len(pending) == 0:
+                    oldest = time.monotonic()
+                pending.append(item)
+                pending_rows += len(item.new) + len(item.unscanned_ids) + len(item.updated) + len(item.unchanged_ids)
+                if pending_rows < self.flush_size:
+                    continue
+
+            if len(pending) > 0:
+                self.save(pending)
+                pending = []
+                pending_rows = 0
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def save(self, pending: list[PendingWrite]):
+        """
+        Saves the pending writes. If the database rejects them (e.g. invalid data), they're split
+        in halves that are saved separately, until the rejected vacancy is found. It's dropped and
+        its reservation is released, so a single bad vacancy doesn't stop the others from being saved.
+        """
+        try:
+            self.write(pending)
+            return
+        except Exception as e:
+            error = e
+
+        units = pending if len(pending) > 1 else [u for w in pending for u in w.split()]
+        if len(units) <= 1:
+            metrics.log("Dropping a vacancy the database rejected!", error=repr(error),
+                        web_ids=[i for w in pending for i in w.new.web_id + w.updated.web_id])
+            self.release(pending)
+            return
+        metrics.log("Database rejected fetched vacancies, saving them in halves", writes=len(units), error=repr(error))
+        half = len(units)//2
+        self.save(units[:half])
+        self.save(units[half:])
+
+    def write(self, pending: list[PendingWrite]):
+        """
+        Saves the pending writes with write_pending(), connection errors (including deadlocks) are
+        retried with exponential backoff. Gives up after max_attempts (3 once closed), the vacancies
+        stay reserved until their lease ends and are fetched again.
+        Throws an exception if the database rejects the writes.
+        """
+        attempts: int = 0
+        while True:
+            attempts += 1
+            try:
+                with pooled_connection() as conn:
+                    write_pending(conn, pending)
+                break
+            except (pg.OperationalError, pg.InterfaceError, PoolError) as e:
+                metrics.log("Failed to save fetched vacancies!", writes=len(pending), attempt=attempts, error=repr(e))
+                if attempts >= (3 if self.closed else self.max_attempts):
+                    metrics.log("Giving up saving fetched vacancies", writes=len(pending))
+                    return
+                metrics.sleep(min(self.retry_interval*2**(attempts-1), self.max_retry_interval), "error")
+        if self.on_saved:
+            try:
+                self.on_saved(pending)
+            except Exception as e:
+                # the writes are saved, they mustn't be split and saved again
+                metrics.log("Failed to handle saved vacancies!", writes=len(pending), error=repr(e))
+
+    def release(self, pending: list[PendingWrite]):
+        """
+        Releases the reservation of the vacancies of writes that won't be saved.
+        """
+        try:
+            with pooled_connection() as conn:
+                release_unscanned_vacancies(conn, [i for w in pending for i in w.unscanned_ids])
+                release_stale_vacancies(conn, [i for w in pending for i in w.updated.db_id + w.unchanged_ids])
+        except Exception as e:
+            # the lease ends on its own
+            metrics.log("Couldn't release the reservation of dropped vacancies!", error=repr(e))
@@ -0,0 +1,137 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Callable, TypeVar
+from utils.util_funcs import get_random
+import utils.metrics as metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+class RateLimiter:
+    """
+    Thread safe token bucket, hands out a request slot every interval_min..interval_max
+    seconds (randomized per slot). Up to `burst` unused slots can be saved up.
+    """
+    def __init__(self, interval_min: float, interval_max: float, burst: int = 1):
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.burst = max(1, burst)
+        self.next_slot: float = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request can be made.
+        """
+        with self.lock:
+            now = time.monotonic()
+            # idle time refills the bucket, but only up to burst slots
+            refilled = now - (self.burst-1)*(self.interval_min+self.interval_max)/2
+            slot = max(self.next_slot, refilled)
+            self.next_slot = slot + get_random(self.interval_min, self.interval_max)
+        metrics.sleep(slot - now, "rate_limit")
+
+class BatchSizer:
+    """
+    Picks how many vacancies to reserve per batch, so a batch takes about target_seconds
+    at the observed fetch throughput. Grows at most 2x per batch, halves if too many fetches fail.
+    """
+    def __init__(self, min_size: int = 5, max_size: int = 200, target_seconds: float = 60,
+                 initial: int = 20, max_error_rate: float = 0.25):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.target_seconds = target_seconds
+        self.max_error_rate = max_error_rate
+        self.size = self.clamp(initial)
+
+    def clamp(self, size: float) -> int:
+        return int(min(self.max_size, max(self.min_size, size)))
+
+    def update(self, attempted: int, failed: int, elapsed: float):
+        """
+        Adjusts the batch size after a batch of `attempted` fetches, `failed` of which failed, took elapsed seconds.
+        """
+        if attempted == 0:
+            return
+        if failed/attempted > self.max_error_rate:
+            # website is struggling (or blocking us), backing off
+            self.size = self.clamp(self.size/2)
+            return
+        rate = attempted/max(elapsed, 1e-3)
+        self.size = self.clamp(min(rate*self.target_seconds, self.size*2))
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_rate_limiter(domain: str, interval_min: float, interval_max: float, burst: int = 1) -> RateLimiter:
+    """
+    Returns the rate limiter for the domain, creating it if necessary.
+    All requests to the same domain should share a single limiter.
+    """
+    with _limiters_lock:
+        if domain not in _limiters:
+            _limiters[domain] = RateLimiter(interval_min, interval_max, burst)
+        return _limiters[domain]
+
+def fetch_concurrently(fetch: Callable[[T], R], jobs: list[T], limiter: RateLimiter,
+                       max_concurrency: int) -> tuple[list[R], list[tuple[T, Exception]]]:
+    """
+    Runs fetch(job) for every job using up to max_concurrency threads, each call
+    waiting for a slot from the rate limiter first.\n
+    Returns: (results in job order, [(failed job, exception)])
+    """
+    def limited(job: T) -> R:
+        limiter.acquire()
+        return fetch(job)
+
+    results: list[R] = []
+    failed: list[tuple[T, Exception]] = []
+    if len(jobs) == 0:
+        return (results, failed)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = [executor.submit(limited, j) for j in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed.append((job, e))
+
+    return (results, failed)
+
+def crawl_pages(fetch_page: Callable[[int], list[str]], page_size: int, limiter: RateLimiter,
+                max_concurrency: int) -> set[str]:
+    """
+    Fetches a paged id list by calling fetch_page(offset) for up to max_concurrency offsets
+    at the same time, each call waiting for a slot from the rate limiter first.
+    Stops requesting new pages once a page shorter than page_size is returned.
+    Throws the exception if fetching any page fails.\n
+    Returns: set of all fetched ids
+    """
+    def limited(offset: int) -> list[str]:
+        limiter.acquire()
+        return fetch_page(offset)
+
+    ids: set[str] = set()
+    next_offset: int = 0
+    last_page_found: bool = False
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        running: set[Future[list[str]]] = set()
+        try:
+            while not last_page_found or len(running) > 0:
+                while not last_page_found and len(running) < max(1, max_concurrency):
+                    running.add(executor.submit(limited, next_offset))
+                    next_offset += page_size
+
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for f in finished:
+                    page = f.result()
+                    ids.update(page)
+                    if len(page) < page_size:
+                        # no more pages after this one
+                        last_page_found = True
+        finally:
+            for f in running:
+                f.cancel()
+
+    return ids
\ No newline at end of file
@@ -0,0 +1,148 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+import utils.metrics as metrics
+
+REQUEST_TIMEOUT: float = 30 # seconds
+
+class NotModifiedError(Exception):
+    """
+    The fetched resource hasn't changed since it was last fetched
+    (the website responded with 304 Not Modified or the content hash is the same).
+    """
+
+class ValidatorStore:
+    """
+    Remembers ETag and Last-Modified headers of fetched urls (up to max_entries,
+    least recently used urls are forgotten first), so they can be refetched conditionally.
+    Validators of a fetched vacancy are staged until the vacancy is saved (confirm()), otherwise a
+    vacancy that failed to parse or save would be "not modified" on its next conditional fetch.
+    """
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.validators: OrderedDict[str, dict[str, str]] = OrderedDict()
+        # (website, web id): (url, validators), unconfirmed ones are forgotten like validators
+        self.staged: OrderedDict[tuple[str, str], tuple[str, dict[str, str]]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def headers_for(self, url: str) -> dict[str, str]:
+        """
+        Returns: conditional request headers for the url, empty if nothing is known about it
+        """
+        with self.lock:
+            if url not in self.validators:
+                return {}
+            self.validators.move_to_end(url)
+            return dict(self.validators[url])
+
+    def remember(self, url: str, response: requests.Response):
+        """
+        Saves the response's validators for the url, its content must already be saved
+        (e.g. it's the same as the saved content).
+        """
+        with self.lock:
+            self.store(url, response_validators(response))
+
+    def stage(self, website: str, web_id: str, url: str, response: requests.Response):
+        """
+        Keeps the response's validators of the vacancy until it's saved, see confirm().
+        """
+        with self.lock:
+            self.staged[(website, web_id)] = (url, response_validators(response))
+            self.staged.move_to_end((website, web_id))
+            while len(self.staged) > self.max_entries:
+                self.staged.popitem(last=False)
+
+    def confirm(self, website: str, web_ids: Iterable[str]):
+        """
+        Saves the staged validators of the vacancies, called once they're saved.
+        """
+        with self.lock:
+            for web_id in web_ids:
+                staged = self.staged.pop((website, web_id), None)
+                if staged:
+                    self.store(*staged)
+
+    def store(self, url: str, headers: dict[str, str]):
+        # the lock must be held
+        if len(headers) == 0:
+            self.validators.pop(url, None)
+            return
+        self.validators[url] = headers
+        self.validators.move_to_end(url)
+        while len(self.validators) > self.max_entries:
+            self.validators.popitem(last=False)
+
+def response_validators(response: requests.Response) -> dict[str, str]:
+    """
+    Returns: conditional request headers for refetching the response's resource
+    """
+    headers: dict[str, str] = {}
+    if "ETag" in response.headers:
+        headers["If-None-Match"] = response.headers["ETag"]
+    if "Last-Modified" in response.headers:
+        headers["If-Modified-Since"] = response.headers["Last-Modified"]
+    return headers
+
+validators = ValidatorStore()
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+def create_session(pool_size: int = 10, retries: int = 3) -> requests.Session:
+    """
+    Creates a session that keeps up to pool_size connections per host alive
+    and retries failed requests (connection errors, 429 and 5xx) with exponential backoff.
+    Compressed responses (gzip/deflate, br if brotli is installed) are requested by default.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=1,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def get_session() -> requests.Session:
+    """
+    Returns the process wide session, creating it on first use.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+def set_session(session: requests.Session):
+    """
+    Replaces the process wide session, e.g. with one that replays recorded responses.
+    """
+    global _session
+    with _session_lock:
+        _session = session
+
+@metrics.timed_function(metrics.STAGE_SECONDS, stage="http")
+def get(url: str, conditional: bool = False, **kwargs) -> requests.Response:
+    """
+    Performs a GET request using the shared session.
+    If conditional, sends the validators remembered for the url (see ValidatorStore) and
+    throws NotModifiedError if the website says the resource hasn't changed.
+    """
+    headers: dict[str, str] = kwargs.pop("headers", {})
+    if conditional:
+        headers = {**validators.headers_for(url), **headers}
+
+    resp = get_session().get(url, headers=headers, timeout=kwargs.pop("timeout", REQUEST_TIMEOUT), **kwargs)
+    metrics.HTTP_RESPONSES.inc(host=urlsplit(url).hostname or "", status=str(resp.status_code))
+    if resp.status_code == 304:
+        raise NotModifiedError(f"{url} hasn't been modified")
+    return resp
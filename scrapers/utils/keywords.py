@@ -0,0 +1,143 @@
+import hashlib, json, os, re, threading
+
+class KeywordMatcher:
+    """
+    Keyword dictionary (keywords.json) compiled into a single regex, so that
+    all categories can be matched against a description in one pass.
+    """
+    def __init__(self, keywords_json: dict[str, dict[str, list[str]]]):
+        self.keywords_json = keywords_json
+        self.version: str = get_keywords_version(keywords_json)
+        aliases: set[str] = set()
+        for category in keywords_json.values():
+            for k in category:
+                aliases.update(category[k])
+
+        # every alias found at a position is a prefix of the longest alias found
+        # at that position, so only the longest one is matched and the shorter
+        # ones are looked up from its prefixes
+        self.hits: dict[str, set[tuple[str, str]]] = {a: set() for a in aliases}
+        for cat_name, category in keywords_json.items():
+            for k in category:
+                for srch in category[k]:
+                    for a in aliases:
+                        if a.startswith(srch):
+                            self.hits[a].add((cat_name, k))
+
+        self.pattern: re.Pattern[str] | None = None
+        if len(aliases) > 0:
+            # same as searching for f" {srch}", but overlapping matches are kept
+            self.pattern = re.compile(f" (?=({_trie_regex(aliases)}))")
+
+    def match(self, to_summarize: str) -> dict[str, list[str]]:
+        """
+        Finds keywords from every category in the text (case insensitive).\n
+        Returns: {category: [matched keywords (keys)]}, keys in keywords.json order
+        """
+        found: set[tuple[str, str]] = set()
+        if self.pattern:
+            for m in self.pattern.finditer(to_summarize.lower()):
+                found.update(self.hits[m.group(1)])
+
+        return {
+            cat_name: [k for k in category if (cat_name, k) in found]
+            for cat_name, category in self.keywords_json.items()
+        }
+
+class KeywordDictionary:
+    """
+    keywords.json file compiled into a KeywordMatcher. Once watch() is called, the file is
+    checked for changes every poll_interval seconds and a recompiled matcher is swapped in.
+    """
+    def __init__(self, path: str, poll_interval: float = 5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.file_stat: tuple[int, int] | None = None
+        self.watcher: threading.Thread | None = None
+        self.stopped = threading.Event()
+        self.current: KeywordMatcher = self.load()
+
+    def load(self) -> KeywordMatcher:
+        """
+        Reads and compiles the keywords file. Throws an exception if the file can't be read.
+        """
+        st = os.stat(self.path)
+        with open(self.path, "r") as file:
+            keywords_json: dict[str, dict[str, list[str]]] = json.load(file)
+        self.file_stat = (st.st_mtime_ns, st.st_size)
+        return KeywordMatcher(keywords_json)
+
+    def reload(self) -> bool:
+        """
+        Recompiles the matcher if the keywords file has changed. If the new file is invalid,
+        the old matcher is kept.\n
+        Returns: whether a new matcher was swapped in
+        """
+        try:
+            st = os.stat(self.path)
+            if (st.st_mtime_ns, st.st_size) == self.file_stat:
+                return False
+            # not retrying (and reporting) a broken file until it changes again
+            self.file_stat = (st.st_mtime_ns, st.st_size)
+            matcher = self.load()
+        except Exception as e:
+            print(f"Couldn't reload keywords from {self.path}, keeping version {self.current.version}!", e)
+            return False
+
+        if matcher.version == self.current.version:
+            return False
+        # a single reference assignment, callers see either the old or the new matcher
+        self.current = matcher
+        print(f"Keywords reloaded from {self.path}, version {matcher.version}")
+        return True
+
+    def watch(self):
+        """
+        Starts checking the keywords file for changes in a background thread.
+        """
+        if self.watcher:
+            return
+
+        def poll():
+            while not self.stopped.wait(self.poll_interval):
+                self.reload()
+
+        self.watcher = threading.Thread(target=poll, name="keywords-watcher", daemon=True)
+        self.watcher.start()
+
+    def stop(self):
+        """
+        Stops watching the keywords file.
+        """
+        self.stopped.set()
+
+def get_keywords_version(keywords_json: dict[str, dict[str, list[str]]]) -> str:
+    """
+    Returns: short hash identifying the keyword dictionary (key order included,
+    since it decides the order of matched keywords)
+    """
+    return hashlib.sha256(json.dumps(keywords_json, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def _trie_regex(aliases: set[str]) -> str:
+    """
+    Builds a regex that matches the longest of the given strings, with common
+    prefixes merged so the regex engine doesn't try every alias one by one.
+    """
+    trie: dict = {}
+    for a in aliases:
+        node = trie
+        for ch in a:
+            node = node.setdefault(ch, {})
+        node[""] = {} # end of alias
+
+    def build(node: dict) -> str:
+        branches = [re.escape(ch) + build(sub) for ch, sub in sorted(node.items()) if ch != ""]
+        if len(branches) == 0:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if "" in node:
+            # alias can end here, but greedily trying to continue first
+            body = f"(?:{body})?"
+        return body
+
+    return build(trie)
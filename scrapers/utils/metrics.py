@@ -0,0 +1,172 @@
+import functools, json, os, threading, time
+import datetime as dt
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterator
+
+DEFAULT_BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(f"{k}=\"{_escape(str(v))}\"" for k, v in labels.items()) + "}"
+
+class Counter:
+    """
+    Thread safe Prometheus style counter, one value per label combination.
+    """
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[tuple[tuple[str, str], ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+class Histogram:
+    """
+    Thread safe Prometheus style histogram, one set of buckets per label combination.
+    """
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # label combination: ([count per bucket], sum, count)
+        self.values: dict[tuple[tuple[str, str], ...], tuple[list[int], float, int]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0]*len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, "le": str(bound)})} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, "le": "+Inf"})} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+# metrics collected by the scrapers and utils
+STAGE_SECONDS = Histogram("scraper_stage_seconds", "Time spent in a vacancy processing stage (http, html, ocr, summarize, get_vacancy_data)")
+DB_CALL_SECONDS = Histogram("scraper_db_call_seconds", "Time spent in a db_connection function")
+SLEEP_SECONDS = Counter("scraper_sleep_seconds_total", "Time spent sleeping on purpose (rate limiting, resting the database, nothing to do)")
+VACANCIES = Counter("scraper_vacancies_total", "Processed vacancies by result (fetched, unchanged, failed, deferred)")
+HTTP_RESPONSES = Counter("scraper_http_responses_total", "HTTP responses by host and status code")
+ALL_METRICS: list[Counter | Histogram] = [STAGE_SECONDS, DB_CALL_SECONDS, SLEEP_SECONDS, VACANCIES, HTTP_RESPONSES]
+
+def render() -> str:
+    """
+    Returns: all metrics in Prometheus text exposition format
+    """
+    lines: list[str] = []
+    for m in ALL_METRICS:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def timed(histogram: Histogram, **labels: str) -> Iterator[None]:
+    """
+    Observes the time spent in the with block, labeled with outcome "ok"
+    or the name of the exception thrown.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException as e:
+        outcome = type(e).__name__
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, outcome=outcome, **labels)
+
+def timed_function(histogram: Histogram, **labels: str) -> Callable:
+    """
+    Decorator version of timed(), if no labels are given the function name is used as the "function" label.
+    """
+    def decorator(func: Callable) -> Callable:
+        func_labels = labels if len(labels) > 0 else {"function": func.__name__}
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(histogram, **func_labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def sleep(seconds: float, reason: str, interrupt: threading.Event | None = None):
+    """
+    time.sleep() that is counted in the sleep metrics. If interrupt is given,
+    the sleep ends early once the event is set.
+    """
+    if seconds <= 0:
+        return
+    SLEEP_SECONDS.inc(seconds, reason=reason)
+    if interrupt:
+        interrupt.wait(seconds)
+    else:
+        time.sleep(seconds)
+
+def log(message: str, **fields):
+    """
+    Prints a log line, as JSON if the LOG_FORMAT environment variable is "json",
+    otherwise as "[time] message" followed by the fields.
+    """
+    now = dt.datetime.now().isoformat()
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        print(json.dumps({"time": now, "message": message, **fields}, ensure_ascii=False, default=str), flush=True)
+    elif len(fields) > 0:
+        print(f"[{now}] {message}", " ".join(f"{k}={v}" for k, v in fields.items()))
+    else:
+        print(f"[{now}] {message}")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes aren't worth logging
+
+def start_metrics_server(port: int) -> ThreadingHTTPServer | None:
+    """
+    Serves the metrics on http://0.0.0.0:port/metrics in a background thread,
+    nothing is started if port is 0.
+    """
+    if port <= 0:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
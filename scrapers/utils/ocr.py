@@ -0,0 +1,108 @@
+import hashlib, os, re, threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from utils.parser import parse_image_bytes_to_string, tesseract_languages
+import utils.metrics as metrics
+
+class OcrCache:
+    """
+    On-disk cache of OCR results (one text file per image). When the cache grows
+    over max_bytes, the least recently used results are removed first.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size: int = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+    @staticmethod
+    def get_key(file_id: str, content: bytes, languages: str) -> str:
+        """
+        Returns: cache key of an image, made from its website file id, content digest
+        and the tesseract languages used
+        """
+        safe_id = re.sub(r"[^A-Za-z0-9_-]", "_", file_id)
+        safe_languages = re.sub(r"[^a-z]", "_", languages)
+        return f"{safe_id}-{hashlib.sha256(content).hexdigest()[:32]}-{safe_languages}"
+
+    def get(self, key: str) -> str | None:
+        """
+        Returns: cached OCR text, None if the image hasn't been parsed yet
+        """
+        path = os.path.join(self.directory, f"{key}.txt")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                text = file.read()
+            os.utime(path) # marking as recently used
+            return text
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, text: str):
+        """
+        Saves OCR text to the cache, evicting old entries if the cache is too big.
+        """
+        path = os.path.join(self.directory, f"{key}.txt")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        with self.lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache is at 90% of max_bytes.
+        Must be called while holding the lock.
+        """
+        entries = [e for e in os.scandir(self.directory) if e.is_file() and e.name.endswith(".txt")]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for e in entries:
+            if self.size <= self.max_bytes*0.9:
+                break
+            try:
+                self.size -= e.stat().st_size
+                os.remove(e.path)
+            except FileNotFoundError:
+                pass
+
+class OcrWorker:
+    """
+    Runs tesseract in a pool of worker processes, so a slow image doesn't hold up
+    other vacancies, and caches the results.
+    """
+    def __init__(self, cache: OcrCache, workers: int = 2, timeout: float = 60):
+        self.cache = cache
+        self.timeout = timeout
+        self.pool = ProcessPoolExecutor(
+            max_workers=max(1, workers),
+            mp_context=mp.get_context("forkserver") # scrapers are multithreaded, forking is unsafe
+        )
+
+    @metrics.timed_function(metrics.STAGE_SECONDS, stage="ocr")
+    def parse(self, file_id: str, content: bytes, lv_enabled: bool = True, en_enabled: bool = True) -> str:
+        """
+        Parses an image from memory into text, using the cached result if the same image was parsed before.
+        Throws an exception if tesseract fails or takes longer than the timeout.
+        """
+        key = OcrCache.get_key(file_id, content, tesseract_languages(lv_enabled, en_enabled))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        text = self.pool.submit(
+            parse_image_bytes_to_string, content, lv_enabled, en_enabled, self.timeout
+        ).result()
+        self.cache.put(key, text)
+        return text
+
+    def close(self):
+        """
+        Shuts down the worker processes.
+        """
+        self.pool.shutdown(cancel_futures=True)
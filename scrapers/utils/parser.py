@@ -1,30 +1,92 @@
 from PIL import Image
 import pytesseract
-from bs4 import BeautifulSoup
-import re
+from lxml import etree
+import re, io
+import utils.metrics as metrics
 
 def parse_image_file_to_string(filepath: str, lv_enabled: bool = True, en_enabled: bool = True) -> str:
     """
     Parses a given image from file into text. Can adjust whether to parse in Latvian and/or English. If none enabled, defaults to both.
     """
+    img = Image.open(filepath)
+    return pytesseract.image_to_string(img, lang=tesseract_languages(lv_enabled, en_enabled))
+
+def parse_image_bytes_to_string(data: bytes, lv_enabled: bool = True, en_enabled: bool = True,
+                                timeout: float = 0) -> str:
+    """
+    Parses a given image from memory into text. Can adjust whether to parse in Latvian and/or English. If none enabled, defaults to both.
+    Throws an exception if tesseract runs longer than timeout seconds (0 means no timeout).
+    """
+    img = Image.open(io.BytesIO(data))
+    return pytesseract.image_to_string(img, lang=tesseract_languages(lv_enabled, en_enabled), timeout=timeout)
+
+def tesseract_languages(lv_enabled: bool, en_enabled: bool) -> str:
+    """
+    Returns: tesseract language string, both languages if none enabled
+    """
     if not lv_enabled and not en_enabled:
         lv_enabled = True
         en_enabled = True
 
-    img = Image.open(filepath)
-    text = pytesseract.image_to_string(img, lang=f"{"eng" if en_enabled else ""}+{"lav" if lv_enabled else ""}")
-    return text
+    return f"{"eng" if en_enabled else ""}+{"lav" if lv_enabled else ""}"
+
+class _TextCollector:
+    """
+    lxml parser target that only collects text, without building a tree.
+    Text inside script, style and template elements is skipped.
+    """
+    SKIPPED = {"script", "style", "template"}
 
+    def __init__(self):
+        self.parts: list[str] = []
+        self.skip_depth: int = 0
+
+    def start(self, tag, attrib):
+        if tag in self.SKIPPED:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        if tag in self.SKIPPED and self.skip_depth > 0:
+            self.skip_depth -= 1
+
+    def data(self, data: str):
+        if self.skip_depth == 0:
+            self.parts.append(data)
+
+    def comment(self, text: str):
+        pass
+
+    def close(self) -> str:
+        return "".join(self.parts)
+
+# runs of punctuation and whitespaces
+_SEPARATORS = re.compile(r"[\s();:,\[\]/{}<>?!.]+")
+# control characters except tab and line breaks, postgres TEXT/JSONB rejects NUL
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+@metrics.timed_function(metrics.STAGE_SECONDS, stage="html")
 def remove_html_tags(text: str) -> str:
     """
-    Removes html tags from text
+    Removes html tags from text, streaming it through lxml's parser
+    instead of building a document tree. Control characters (except tabs
+    and line breaks) are replaced with spaces
     """
-    return BeautifulSoup(text, "lxml").text
+    if "<" not in text and "&" not in text:
+        # nothing to parse, only dropping leading whitespaces like the parser does
+        return _CONTROL_CHARS.sub(" ", text.lstrip(" \t\n\r"))
+    parser = etree.HTMLParser(target=_TextCollector())
+    parser.feed(text)
+    # the parser passes most control characters through, even from entities like &#1;
+    return _CONTROL_CHARS.sub(" ", parser.close())
 
 def clean_description(description: str) -> str:
     """
     Replaces punctuation and whitespaces with a single space
     """
-    description = re.sub(r'[();:,\[\]/{}<>?!.]', ' ', description) # punctuation
-    description = re.sub(r'\s+', ' ', description) # whitespaces
-    return description
\ No newline at end of file
+    return _SEPARATORS.sub(" ", description)
+
+def normalize_description(description: str) -> str:
+    """
+    Removes html tags, then replaces punctuation and whitespaces with a single space
+    """
+    return clean_description(remove_html_tags(description))
@@ -0,0 +1,81 @@
+# Summarizes stored vacancy descriptions again without fetching anything from the websites,
+# meant to be run after keywords.json has changed (see README.md)
+import argparse, json, os, time
+import datetime as dt
+import multiprocessing as mp
+from typing import Iterable, Iterator
+import utils.db_connection as db
+from utils.keywords import KeywordMatcher, get_keywords_version
+from utils.summarizer import create_summarized_description
+
+_keywords: KeywordMatcher | None = None
+
+def init_worker(keywords_json: dict[str, dict[str, list[str]]]):
+    """
+    Compiles the keyword matcher once per worker process.
+    """
+    global _keywords
+    _keywords = KeywordMatcher(keywords_json)
+
+def summarize_row(row: tuple[int, str | None, str, list[str]]) -> tuple[int, str]:
+    """
+    Summarizes a stored vacancy (title and description), keeping its languages.
+    Serialized in the worker, so only a string is sent back to the main process.\n
+    Returns: (db_row_id, summarized description JSON)
+    """
+    db_id, title, description, languages = row
+    summarized = create_summarized_description(f" {title or ''}  {description} ", _keywords)
+    summarized.languages = languages
+    # keywords listed separately on the website (skills) aren't stored, so the summary isn't
+    # complete: no keywords version, the next stale check fetches and summarizes the vacancy again
+    summarized.keywords_version = None
+    return (db_id, summarized.to_json())
+
+def report_progress(summaries: Iterable[tuple[int, str]], every: int = 5000) -> Iterator[tuple[int, str]]:
+    """
+    Passes summaries through, printing the throughput every `every` rows.
+    """
+    started = time.monotonic()
+    done: int = 0
+    for s in summaries:
+        yield s
+        done += 1
+        if done % every == 0:
+            elapsed = time.monotonic() - started
+            print(f"[{dt.datetime.now().isoformat()}] {done} vacancies summarized ({done/elapsed:.0f} rows/s)")
+
+def resummarize(website: str | None, keywords_json: dict[str, dict[str, list[str]]], workers: int,
+                only_outdated: bool = True) -> int:
+    """
+    Summarizes all stored vacancies of the website (all websites if None) using a pool
+    of worker processes and writes the new summaries back in bulk. If only_outdated,
+    vacancies already summarized with this keywords version are skipped.\n
+    Returns: amount of summarized vacancies
+    """
+    read_conn = db.get_connection()
+    write_conn = db.get_connection()
+    try:
+        version = get_keywords_version(keywords_json) if only_outdated else None
+        rows = db.iter_vacancy_descriptions(read_conn, website, version)
+        with mp.get_context("forkserver").Pool(max(1, workers), init_worker, (keywords_json,)) as pool:
+            summaries = pool.imap(summarize_row, rows, chunksize=64)
+            return db.update_summaries(write_conn, report_progress(summaries))
+    finally:
+        db.close_connection(read_conn)
+        db.close_connection(write_conn)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize stored vacancy descriptions again")
+    parser.add_argument("--source", default=None, help="website to resummarize, e.g. cv.lv (default: all)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="summarizer processes")
+    parser.add_argument("--keywords", default="/keywords.json", help="keywords.json path")
+    parser.add_argument("--all", action="store_true", help="also resummarize vacancies summarized with the current keywords")
+    args = parser.parse_args()
+
+    with open(args.keywords, "r") as file:
+        keywords_json: dict[str, dict[str, list[str]]] = json.load(file)
+
+    started = time.monotonic()
+    total = resummarize(args.source, keywords_json, args.workers, not args.all)
+    elapsed = time.monotonic() - started
+    print(f"[{dt.datetime.now().isoformat()}] Resummarized {total} vacancies in {elapsed:.1f}s ({total/max(elapsed, 1e-9):.0f} rows/s)")
@@ -0,0 +1,353 @@
+# Runs one or more website scrapers (sources) in a single process. Every source gets its own
+# thread and rate limiter, while the HTTP session, database pool, keywords and metrics are shared.
+# Run from the scrapers directory: python -m utils.runtime cv-lv cvvp-nva-gov-lv
+import importlib.util, os, signal, sys, threading, time
+import datetime as dt
+from dataclasses import dataclass
+from typing import Callable, Iterable, TypeVar
+import psycopg2.extensions as pgext
+import utils.archive as archive
+import utils.db_connection as db
+import utils.metrics as metrics
+from utils.fetcher import BatchSizer, RateLimiter, get_rate_limiter, fetch_concurrently
+import utils.http_client as http
+from utils.http_client import NotModifiedError
+from utils.keywords import KeywordMatcher, KeywordDictionary
+from utils.util_classes import Vacancy, PendingWrite
+
+T = TypeVar("T")
+R = TypeVar("R")
+SCRAPERS_DIR: str = os.path.join(os.path.dirname(__file__), "..")
+
+class StopRequested(Exception):
+    """
+    The runtime is shutting down, the current batch is abandoned.
+    """
+
+class FetchDeferredError(Exception):
+    """
+    The vacancy can't be told apart from a removed one right now (e.g. while the website is being
+    updated). An unscanned vacancy stays reserved until its lease ends instead of being dropped.
+    """
+
+class Source:
+    """
+    A website to scrape, every scraper implements one. Only list_ids and fetch_detail are required.
+    """
+    domain: str = "" # website in the sources table
+    # the website's rate limiter, set by the runtime before the source is used, for requests
+    # that aren't made in the slots list_ids and fetch_detail wait for
+    limiter: RateLimiter | None = None
+
+    def list_ids(self, limiter: RateLimiter, max_concurrency: int) -> Iterable[str]:
+        """
+        Returns (or yields) the web ids of all currently listed vacancies, waiting for the
+        limiter before every request. Throws an exception if the list couldn't be fetched.
+        """
+        raise NotImplementedError
+
+    def prepare(self):
+        """
+        Called before every batch of vacancy details, throws an exception if the
+        website can't be scraped right now.
+        """
+
+    def fetch_detail(self, web_id: str, db_id: int, keywords: KeywordMatcher,
+                     refresh: bool = False, known_hash: str | None = None) -> Vacancy:
+        """
+        Gets detailed data about a vacancy, throws an exception if couldn't fetch data.
+        If refreshing, throws NotModifiedError if the vacancy hasn't changed since the last fetch
+        or its content hash is the same as known_hash.\n
+        Returns: Vacancy with nearly all data up to date
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Frees the source's resources once the runtime stops.
+        """
+
+@dataclass
+class RuntimeSettings:
+    web_request_interval_min: float = 0.5
+    web_request_interval_max: float = 1.0
+    max_concurrency: int = 4 # detail fetches at the same time, per source
+    db_request_interval: float = 3.0
+    nothing_todo_interval: float = 60.0
+    batch_target_seconds: float = 60.0
+    batch_max_size: int = 200
+    batch_lease: dt.timedelta = dt.timedelta(hours=2)
+    write_flush_size: int = 200 # vacancies saved in a single transaction
+    write_flush_interval: float = 5.0
+    write_max_queued: int = 16 # fetched batches waiting to be saved
+    metrics_port: int = 0
+    keywords_path: str = "/keywords.json"
+
+def load_settings() -> RuntimeSettings:
+    """
+    Returns: settings from the environment variables (see README.md), defaults for the missing ones
+    """
+    return RuntimeSettings(
+        web_request_interval_min=float(os.getenv("WEB_REQUEST_INTERVAL_MIN", "0.5")),
+        web_request_interval_max=float(os.getenv("WEB_REQUEST_INTERVAL_MAX", "1.0")),
+        max_concurrency=int(os.getenv("WEB_MAX_CONCURRENCY", "4")),
+        db_request_interval=float(os.getenv("DB_REQUEST_INTERVAL", "3.0")),
+        nothing_todo_interval=float(os.getenv("NOTHING_TODO_INTERVAL", "60.0")),
+        batch_target_seconds=float(os.getenv("BATCH_TARGET_SECONDS", "60.0")),
+        batch_max_size=int(os.getenv("BATCH_MAX_SIZE", "200")),
+        batch_lease=dt.timedelta(seconds=float(os.getenv("BATCH_LEASE_SECONDS", "7200"))),
+        write_flush_size=int(os.getenv("WRITE_FLUSH_SIZE", "200")),
+        write_flush_interval=float(os.getenv("WRITE_FLUSH_INTERVAL", "5.0")),
+        write_max_queued=int(os.getenv("WRITE_MAX_QUEUED", "16")),
+        metrics_port=int(os.getenv("METRICS_PORT", "0"))
+    )
+
+def load_scraper(directory: str):
+    """
+    Imports a scraper's scraper.py (scraper directories aren't valid module names).
+    """
+    path = os.path.join(SCRAPERS_DIR, directory, "scraper.py")
+    spec = importlib.util.spec_from_file_location(f"{directory.replace("-", "_").replace(".", "_")}_scraper", path)
+    if spec is None or spec.loader is None:
+        raise Exception(f"Couldn't load scraper {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def stoppable(fetch: Callable[[T], R], stop: threading.Event) -> Callable[[T], R]:
+    """
+    Returns: fetch that throws StopRequested instead of starting once the runtime is stopping
+    """
+    def wrapper(job: T) -> R:
+        if stop.is_set():
+            raise StopRequested()
+        return fetch(job)
+    return wrapper
+
+def rescan(conn: pgext.connection, source: Source, limiter: RateLimiter, settings: RuntimeSettings):
+    """
+    Refetches the whole vacancy list of the source and syncs it with the database.
+    """
+    metrics.log("Website stale, rescanning...!", source=source.domain)
+    db.set_website_scan_status(conn, source.domain, True)
+    try:
+        # uploading vacancy ids to database while the list is still downloading
+        db.sync_vacancy_ids(conn, source.list_ids(limiter, settings.max_concurrency), source.domain)
+    except Exception as e:
+        metrics.log("An exception occoured while rescanning vacancy list!", source=source.domain, error=repr(e))
+    finally:
+        db.set_website_scan_status(conn, source.domain, False)
+    metrics.log("Website rescanned!", source=source.domain)
+
+def release_reservation(conn: pgext.connection, release: Callable[[pgext.connection, list[int]], None],
+                        db_ids: list[int], source: str):
+    """
+    Releases the reservation of an unfinished batch (release is db.release_unscanned_vacancies or
+    db.release_stale_vacancies, both commit), using a pooled connection if conn is broken.
+    Never throws, so the exception that ended the batch isn't hidden.
+    """
+    try:
+        conn.rollback()
+        release(conn, db_ids)
+        return
+    except Exception as e:
+        metrics.log("Couldn't release reservation, retrying with another connection", source=source, error=repr(e))
+    try:
+        with db.pooled_connection() as fresh:
+            release(fresh, db_ids)
+    except Exception as e:
+        # the lease ends on its own
+        metrics.log("Couldn't release reservation!", source=source, vacancies=len(db_ids), error=repr(e))
+
+def process_unscanned(conn: pgext.connection, source: Source, keywords: KeywordDictionary, limiter: RateLimiter,
+                      sizer: BatchSizer, writer: db.VacancyWriter, settings: RuntimeSettings, stop: threading.Event) -> int:
+    """
+    Reserves a batch of unscanned vacancies, fetches them and hands them to the writer, which adds
+    them to the database in the background. The reservation is released if the batch isn't finished.\n
+    Returns: amount of reserved vacancies
+    """
+    unscanned_vacancies = db.get_unscanned_vacancies(conn, source.domain, sizer.size, settings.batch_lease)
+    if len(unscanned_vacancies) == 0:
+        return 0
+
+    metrics.log("Fetching info for unscanned vacancies...", source=source.domain, vacancies=len(unscanned_vacancies))
+    started = time.monotonic()
+    ids: list[int] = [i[1] for i in unscanned_vacancies]
+    try:
+        fetched, failed = fetch_concurrently(
+            stoppable(lambda sv: source.fetch_detail(sv[0], sv[1], keywords.current), stop),
+            unscanned_vacancies, limiter, settings.max_concurrency
+        )
+        if stop.is_set():
+            raise StopRequested()
+        deferred: set[int] = set()
+        for sv, e in failed:
+            if isinstance(e, FetchDeferredError):
+                deferred.add(sv[1])
+            metrics.log("Failed to get vacancy data", source=source.domain, web_id=sv[0], error=repr(e))
+        metrics.log("Unscanned vacancy info fetched!", source=source.domain, fetched=len(fetched), failed=len(failed), deferred=len(deferred))
+        metrics.VACANCIES.inc(len(fetched), source=source.domain, result="fetched")
+        metrics.VACANCIES.inc(len(failed)-len(deferred), source=source.domain, result="failed")
+        metrics.VACANCIES.inc(len(deferred), source=source.domain, result="deferred")
+        # failed vacancies aren't retried, their unscanned rows are deleted too,
+        # deferred ones are fetched again once their lease ends
+        writer.add(PendingWrite(source.domain, new=db.convert_vacancies_to_columns(fetched),
+                                unscanned_ids=[i for i in ids if i not in deferred]))
+    except BaseException:
+        # batch wasn't finished, releasing the reservation instead of waiting for it to expire
+        release_reservation(conn, db.release_unscanned_vacancies, ids, source.domain)
+        raise
+    elapsed = time.monotonic() - started
+    sizer.update(len(unscanned_vacancies), len(failed), elapsed)
+    metrics.sleep(settings.db_request_interval - elapsed, "db_rest", stop) # letting database rest a little, if the batch was quick
+    return len(unscanned_vacancies)
+
+def process_stale(conn: pgext.connection, source: Source, keywords: KeywordDictionary, limiter: RateLimiter,
+                  sizer: BatchSizer, writer: db.VacancyWriter, settings: RuntimeSettings, stop: threading.Event) -> int:
+    """
+    Reserves a batch of stale vacancies, refetches them and hands them to the writer, which updates
+    them in the background. The reservation is released if the batch isn't finished.\n
+    Returns: amount of reserved vacancies
+    """
+    stale_vacancies = db.get_stale_vacancies(conn, source.domain, sizer.size, settings.batch_lease)
+    if len(stale_vacancies) == 0:
+        return 0
+
+    metrics.log("Fetching info for stale vacancies...", source=source.domain, vacancies=len(stale_vacancies))
+    started = time.monotonic()
+
+    def refetch(sv: tuple[str, int, str | None, str | None]) -> Vacancy:
+        matcher = keywords.current
+        if sv[3] != matcher.version or sv[2] is None:
+            # summarized with other keywords or without a content hash (e.g. listed again after expiring),
+            # parsing it again even if it hasn't changed
+            return source.fetch_detail(sv[0], sv[1], matcher)
+        return source.fetch_detail(sv[0], sv[1], matcher, refresh=True, known_hash=sv[2])
+
+    try:
+        fetched, failed = fetch_concurrently(stoppable(refetch, stop), stale_vacancies, limiter, settings.max_concurrency)
+        if stop.is_set():
+            raise StopRequested()
+        unchanged: list[int] = []
+        for sv, e in failed:
+            if isinstance(e, NotModifiedError):
+                unchanged.append(sv[1])
+            else:
+                metrics.log("Failed to get vacancy data", source=source.domain, web_id=sv[0], error=repr(e))
+        metrics.log("Vacancy info fetched!", source=source.domain, fetched=len(fetched), unchanged=len(unchanged), failed=len(failed)-len(unchanged))
+        metrics.VACANCIES.inc(len(fetched), source=source.domain, result="fetched")
+        metrics.VACANCIES.inc(len(unchanged), source=source.domain, result="unchanged")
+        metrics.VACANCIES.inc(len(failed)-len(unchanged), source=source.domain, result="failed")
+        writer.add(PendingWrite(source.domain, updated=db.convert_vacancies_to_columns(fetched), unchanged_ids=unchanged))
+    except BaseException:
+        # batch wasn't finished, releasing the reservation instead of waiting for it to expire
+        release_reservation(conn, db.release_stale_vacancies, [i[1] for i in stale_vacancies], source.domain)
+        raise
+    elapsed = time.monotonic() - started
+    sizer.update(len(stale_vacancies), len(failed)-len(unchanged), elapsed)
+    metrics.sleep(settings.db_request_interval - elapsed, "db_rest", stop) # letting database rest a little, if the batch was quick
+    return len(stale_vacancies)
+
+def run_source(source: Source, keywords: KeywordDictionary, writer: db.VacancyWriter,
+               settings: RuntimeSettings, stop: threading.Event):
+    """
+    Scrapes the source until stop is set: rescans the vacancy list when it's stale, then
+    fetches unscanned and stale vacancies in batches. An exception only pauses the source.
+    """
+    limiter = get_rate_limiter(source.domain, settings.web_request_interval_min, settings.web_request_interval_max)
+    source.limiter = limiter
+    unscanned_sizer = BatchSizer(max_size=settings.batch_max_size, target_seconds=settings.batch_target_seconds)
+    stale_sizer = BatchSizer(max_size=settings.batch_max_size, target_seconds=settings.batch_target_seconds)
+
+    db_con = None
+    while not stop.is_set():
+        try:
+            if not db_con:
+                db_con = db.acquire_connection()
+
+            # updating website vacancy list if its outdated
+            if db.check_if_website_stale(db_con, source.domain):
+                rescan(db_con, source, limiter, settings)
+                metrics.sleep(settings.db_request_interval, "db_rest", stop) # letting database rest a little
+
+            try:
+                source.prepare()
+            except Exception as e:
+                metrics.log("Couldn't prepare website for scraping!", source=source.domain, error=repr(e))
+                db.release_connection(db_con)
+                db_con = None
+                metrics.sleep(settings.nothing_todo_interval, "error", stop) # max wait time, since this is a big error
+                continue
+
+            # Updating unscanned & stale vacancy info
+            unscanned = process_unscanned(db_con, source, keywords, limiter, unscanned_sizer, writer, settings, stop)
+            stale = process_stale(db_con, source, keywords, limiter, stale_sizer, writer, settings, stop)
+            if unscanned == 0 and stale == 0:
+                db.release_connection(db_con)
+                db_con = None
+                metrics.sleep(settings.nothing_todo_interval, "nothing_todo", stop)
+        except StopRequested:
+            break
+        except Exception as e:
+            metrics.log("Scraping failed!", source=source.domain, error=repr(e))
+            if db_con:
+                db.release_connection(db_con)
+                db_con = None
+            metrics.sleep(settings.nothing_todo_interval, "error", stop)
+
+    if db_con:
+        db.release_connection(db_con)
+    metrics.log("Stopped scraping", source=source.domain)
+
+def confirm_validators(writes: list[PendingWrite]):
+    """
+    Saved vacancies can be refetched conditionally, see http_client.ValidatorStore.
+    """
+    for w in writes:
+        http.validators.confirm(w.website, w.new.web_id + w.updated.web_id)
+
+def run_sources(sources: list[Source], settings: RuntimeSettings):
+    """
+    Scrapes all sources concurrently until SIGTERM (docker stop) or SIGINT is received,
+    unfinished batches are released and fetched vacancies are saved before returning.
+    """
+    metrics.start_metrics_server(settings.metrics_port)
+    # Reading keywords.json, changes are picked up without restarting
+    keywords = KeywordDictionary(settings.keywords_path)
+    keywords.watch()
+    writer = db.VacancyWriter(settings.write_flush_size, settings.write_flush_interval, settings.write_max_queued,
+                              on_saved=confirm_validators)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    threads = [
+        threading.Thread(target=run_source, args=(s, keywords, writer, settings, stop), name=f"source-{s.domain}")
+        for s in sources
+    ]
+    try:
+        for t in threads:
+            t.start()
+        # joining with a timeout, so the signal handlers get to run
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=1)
+    finally:
+        stop.set()
+        for t in threads:
+            if t.is_alive():
+                t.join()
+        writer.close()
+        archive.close_archive()
+        keywords.stop()
+        for s in sources:
+            s.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m utils.runtime SCRAPER_DIRECTORY [SCRAPER_DIRECTORY ...]")
+        sys.exit(1)
+
+    # every scraper.py provides create_source(), reading its own environment variables
+    run_sources([load_scraper(d).create_source() for d in sys.argv[1:]], load_settings())
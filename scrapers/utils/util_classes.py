@@ -1,8 +1,14 @@
+import json
 import datetime as dt
-from dataclasses import dataclass, field
-from psycopg2.extras import Json
+from dataclasses import dataclass, field, fields
+from typing import Iterable
 
-@dataclass
+try:
+    import orjson # optional, serializes summaries several times faster
+except ImportError:
+    orjson = None
+
+@dataclass(slots=True)
 class SummarizedDescription:
     languages: list[str]
     frameworks: list[str]
@@ -11,8 +17,19 @@ class SummarizedDescription:
     business_software: list[str]
     programming_languages: list[str]
     general_keywords: list[str]
+    keywords_version: str | None = None # keyword dictionary version used for summarizing
+
+    def to_json(self) -> str:
+        """
+        Returns: the summarized description as a JSON object
+        """
+        if orjson:
+            return orjson.dumps(self).decode("utf-8")
+        return json.dumps({name: getattr(self, name) for name in _SUMMARY_FIELDS}, ensure_ascii=False)
+
+_SUMMARY_FIELDS: tuple[str, ...] = tuple(f.name for f in fields(SummarizedDescription))
 
-@dataclass
+@dataclass(slots=True)
 class Vacancy:
     web_id: str
     db_id: int | None = None
@@ -28,9 +45,15 @@ class Vacancy:
     city_name: str | None = None
     description: str | None = None
     summarized_description: SummarizedDescription | None = None
+    content_hash: str | None = None
 
-@dataclass
-class VacanciesList:
+@dataclass(slots=True)
+class VacancyBatch:
+    """
+    Vacancies stored column by column, in the form the database procedures take them.
+    Summarized descriptions are serialized to JSON while appending, so the columns
+    can be handed to the database as they are.
+    """
     db_id: list[int | None] = field(default_factory=list)
     title: list[str | None] = field(default_factory=list)
     employer: list[str | None] = field(default_factory=list)
@@ -44,4 +67,70 @@ class VacanciesList:
     city_name: list[str | None] = field(default_factory=list)
     web_id: list[str] = field(default_factory=list)
     description: list[str | None] = field(default_factory=list)
-    summarized_description: list[Json | None] = field(default_factory=list)
\ No newline at end of file
+    summarized_description: list[str | None] = field(default_factory=list) # JSON
+    content_hash: list[str | None] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.web_id)
+
+    def append(self, v: Vacancy):
+        self.db_id.append(v.db_id)
+        self.title.append(v.title)
+        self.employer.append(v.employer)
+        self.salary_min.append(v.salary_min)
+        self.salary_max.append(v.salary_max)
+        self.hourly_rate.append(v.hourly_rate)
+        self.remote.append(v.remote)
+        self.published.append(v.published)
+        self.expires.append(v.expires)
+        self.country_code.append(v.country_code)
+        self.city_name.append(v.city_name)
+        self.web_id.append(v.web_id)
+        self.description.append(v.description)
+        self.summarized_description.append(v.summarized_description.to_json() if v.summarized_description else None)
+        self.content_hash.append(v.content_hash)
+
+    def extend(self, vacancies: Iterable[Vacancy]):
+        for v in vacancies:
+            self.append(v)
+
+    def merge(self, other: "VacancyBatch"):
+        """
+        Appends all vacancies of the other batch, column by column.
+        """
+        for name in _BATCH_COLUMNS:
+            getattr(self, name).extend(getattr(other, name))
+
+    def row(self, i: int) -> "VacancyBatch":
+        """
+        Returns: batch of only the i-th vacancy
+        """
+        return VacancyBatch(**{name: [getattr(self, name)[i]] for name in _BATCH_COLUMNS})
+
+_BATCH_COLUMNS: tuple[str, ...] = tuple(f.name for f in fields(VacancyBatch))
+
+@dataclass(slots=True)
+class PendingWrite:
+    website: str
+    new: VacancyBatch = field(default_factory=VacancyBatch) # fetched unscanned vacancies
+    unscanned_ids: list[int] = field(default_factory=list) # unscanned rows to delete (fetched and failed)
+    updated: VacancyBatch = field(default_factory=VacancyBatch) # fetched stale vacancies
+    unchanged_ids: list[int] = field(default_factory=list) # stale vacancies that haven't changed
+
+    def split(self) -> list["PendingWrite"]:
+        """
+        Returns: the write split into writes of a single vacancy, a new vacancy stays
+        together with the deletion of its unscanned row (its db_id)
+        """
+        units: list[PendingWrite] = []
+        unscanned = set(self.unscanned_ids)
+        for i in range(len(self.new)):
+            db_id = self.new.db_id[i]
+            ids = [db_id] if db_id in unscanned else []
+            unscanned.discard(db_id)
+            units.append(PendingWrite(self.website, new=self.new.row(i), unscanned_ids=ids))
+        # failed vacancies' unscanned rows
+        units += [PendingWrite(self.website, unscanned_ids=[i]) for i in self.unscanned_ids if i in unscanned]
+        units += [PendingWrite(self.website, updated=self.updated.row(i)) for i in range(len(self.updated))]
+        units += [PendingWrite(self.website, unchanged_ids=[i]) for i in self.unchanged_ids]
+        return units
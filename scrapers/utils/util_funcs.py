@@ -1,4 +1,27 @@
-import random
+import random, hashlib, json
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
 
 def get_random(min: float = 0, max: float = 1) -> float:
-    return min+(max-min)*random.random()
\ No newline at end of file
+    return min+(max-min)*random.random()
+
+def get_content_hash(content) -> str:
+    """
+    Returns a hash of JSON serializable content, that doesn't depend on dictionary key order.
+    """
+    serialized = json.dumps(content, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
+
+def chunked(items: Iterable[T], size: int) -> Iterator[list[T]]:
+    """
+    Splits items (can be a generator) into lists of up to size items.
+    """
+    chunk: list[T] = []
+    for i in items:
+        chunk.append(i)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
\ No newline at end of file